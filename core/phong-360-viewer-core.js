@@ -74,6 +74,7 @@
             this.isLoading = false;
             this.isFirstLoad = true;
             this.loadingOverlay = null;
+            this.overlayBackground = null;  // Restored once a placeholder load finishes
 
             // Interaction state
             this.isUserInteracting = false;
@@ -356,6 +357,10 @@
                 setTimeout(() => {
                     if (this.loadingOverlay) {
                         this.loadingOverlay.style.display = 'none';
+                        if (this.overlayBackground !== null) {
+                            this.loadingOverlay.style.background = this.overlayBackground;
+                            this.overlayBackground = null;
+                        }
                     }
                 }, 200);
             }
@@ -401,8 +406,9 @@
          * @param {string} url - Image URL
          * @param {number} width - Image width
          * @param {number} height - Image height
+         * @param {string} [placeholder] - Tiny image URL (e.g. a decoded BlurHash) shown on the sphere until the full image arrives
          */
-        async loadImage(url, width = 4096, height = 2048) {
+        async loadImage(url, width = 4096, height = 2048, placeholder = null) {
             // Prevent concurrent loads
             if (this.isLoading) {
                 console.log('[Phong360ViewerCore] Already loading, ignoring request');
@@ -422,13 +428,35 @@
 
             const loader = new THREE.TextureLoader();
 
+            let settled = false;
+
+            // Paint the placeholder right away and let it show through the overlay
+            if (placeholder) {
+                loader.load(placeholder, (texture) => {
+                    if (settled) {
+                        texture.dispose();
+                        return;
+                    }
+                    this.disposeCurrentTexture();
+                    this.applyTexture(texture);
+                    if (this.loadingOverlay) {
+                        this.overlayBackground = this.loadingOverlay.style.background;
+                        this.loadingOverlay.style.background = 'rgba(0, 0, 0, 0.35)';
+                    }
+                });
+            }
+
             return new Promise((resolve, reject) => {
                 loader.load(
                     url,
                     (texture) => {
+                        settled = true;
                         console.log('[Phong360ViewerCore] Texture loaded successfully:', url);
                         console.log('[Phong360ViewerCore] Texture dimensions:', texture.image.width, 'x', texture.image.height);
 
+                        if (placeholder) {
+                            this.disposeCurrentTexture();
+                        }
                         this.applyTexture(texture);
                         console.log('[Phong360ViewerCore] Material applied to mesh');
 
@@ -445,6 +473,7 @@
                         // Optional: track loading progress
                     },
                     (error) => {
+                        settled = true;
                         console.error('[Phong360ViewerCore] Error loading image:', url, error);
                         this.hideLoading();
                         this.isLoading = false;
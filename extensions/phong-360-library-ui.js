@@ -36,11 +36,12 @@ class BaseRenderer {
         title.textContent = this.section.title || this.section.id || 'Section';
         heading.appendChild(title);
 
-        const images = this.section.images || [];
-        if (images.length > 0) {
+        // Sharded libraries carry the count before the images are fetched
+        const imageCount = (this.section.images || []).length || this.section.count || 0;
+        if (imageCount > 0) {
             const count = document.createElement('span');
             count.className = 'p360-section-heading-count';
-            count.textContent = images.length;
+            count.textContent = imageCount;
             heading.appendChild(count);
         }
 
@@ -65,6 +66,8 @@ class BaseRenderer {
             const isAbsolute = thumbPath.startsWith('/') || thumbPath.startsWith('http');
             img.dataset.src = isAbsolute ? thumbPath : this.config.baseUrl + thumbPath;
             img.alt = image.title || image.name || '';
+            this._trackPlaceholder(img, image);
+            this._trackSprite(img, image);
         }
 
         wrapper.appendChild(img);
@@ -143,6 +146,33 @@ class BaseRenderer {
         return this.config.baseUrl + path;
     }
 
+    /**
+     * Remember the image's inline placeholder (BlurHash/LQIP) for a lazy
+     * thumbnail; it is painted behind the thumbnail when it scrolls into view.
+     */
+    _trackPlaceholder(img, image) {
+        if (image.placeholder) {
+            this.engine._placeholders.set(img, image.placeholder);
+        }
+    }
+
+    /**
+     * Remember where a lazy thumbnail sits in its section's sprite atlas
+     * (thumbnail.sprite); the atlas is fetched once for all its thumbnails.
+     */
+    _trackSprite(img, image) {
+        const sprite = image.thumbnail?.sprite;
+        if (sprite) {
+            this.engine._sprites.set(img, {
+                url: this._resolvePath(sprite.path),
+                x: sprite.x,
+                y: sprite.y,
+                width: image.thumbnail.width,
+                height: image.thumbnail.height
+            });
+        }
+    }
+
     _resolveIcon(iconStr) {
         if (!iconStr) return '';
         // If already a full Phosphor class (e.g. "ph ph-folder")
@@ -185,6 +215,8 @@ class FeedRenderer extends BaseRenderer {
             if (thumbPath) {
                 img.dataset.src = this._resolvePath(thumbPath);
                 img.alt = image.title || image.name || '';
+                this._trackPlaceholder(img, image);
+                this._trackSprite(img, image);
             }
             item.appendChild(img);
 
@@ -239,11 +271,12 @@ class AccordionRenderer extends BaseRenderer {
         titleSpan.textContent = this.section.title || this.section.id || 'Section';
         trigger.appendChild(titleSpan);
 
-        const images = this.section.images || [];
-        if (images.length > 0) {
+        // Sharded libraries carry the count before the images are fetched
+        const imageCount = (this.section.images || []).length || this.section.count || 0;
+        if (imageCount > 0) {
             const count = document.createElement('span');
             count.className = 'p360-section-heading-count';
-            count.textContent = images.length;
+            count.textContent = imageCount;
             trigger.appendChild(count);
         }
 
@@ -298,6 +331,8 @@ class HeroRenderer extends BaseRenderer {
         if (thumbPath) {
             img.dataset.src = this._resolvePath(thumbPath);
             img.alt = image.title || image.name || '';
+            this._trackPlaceholder(img, image);
+            this._trackSprite(img, image);
         }
         el.appendChild(img);
 
@@ -347,6 +382,8 @@ class ListRenderer extends BaseRenderer {
                 img.className = 'p360-list-item-thumb';
                 img.dataset.src = this._resolvePath(thumbPath);
                 img.alt = image.title || image.name || '';
+                this._trackPlaceholder(img, image);
+                this._trackSprite(img, image);
                 item.appendChild(img);
             }
 
@@ -649,6 +686,11 @@ class Phong360LibraryUI {
         this._toggle = null;
         this._contentEl = null;
         this._observer = null;
+        this._shardObserver = null;
+        this._shardLoads = new WeakMap();    // sharded section -> Promise of its images
+        this._placeholders = new WeakMap();  // thumbnail <img> -> image placeholder
+        this._sprites = new WeakMap();       // thumbnail <img> -> atlas URL and rectangle
+        this._atlases = new Map();           // atlas URL -> Promise<HTMLImageElement>
 
         // Initialize
         this.init();
@@ -1035,35 +1077,136 @@ class Phong360LibraryUI {
             const resp = await fetch(this.libraryUrl);
             if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
             const data = await resp.json();
-            this._processLibraryData(data);
+            const sharded = (data.sections || []).filter(s => s.shards && !s.images);
+            if (sharded.length === 0) {
+                this._processLibraryData(data);
+                return;
+            }
+            // Sharded library: paint the section index first; each section's
+            // shards are fetched once it scrolls into view
+            this._processLibraryData(data, { partial: true });
+            await this._watchShardedSections(sharded);
+            await this._loadLinkedSection(sharded);
+            this._finishLibraryLoad(data);
         } catch (error) {
             console.error('Error loading library:', error);
         }
     }
 
-    _processLibraryData(data) {
-        this.libraryData = data;
-        this._context = data.context || null;
-        this._sections = data.sections || [];
-        this._allImages = [];
-
-        // Flatten all images from all sections
-        for (const section of this._sections) {
-            if (section.images) {
-                this._allImages.push(...section.images);
-            }
-            if (section.items) {
-                // items can also contain images (avatar sections)
-                for (const item of section.items) {
-                    if (item.resolutions) this._allImages.push(item);
+    /**
+     * Load each sharded section when its element (or just its heading, while
+     * collapsed) comes within 200px of the visible list. Resolves once the
+     * sections visible right after the index is painted have loaded.
+     */
+    _watchShardedSections(sections) {
+        const byId = new Map(sections.map(section => [section.id, section]));
+        const elements = [...this._contentEl.querySelectorAll('.p360-section')]
+            .filter(el => byId.has(el.dataset.sectionId));
+        if (this._shardObserver) this._shardObserver.disconnect();
+        if (typeof IntersectionObserver === 'undefined') {
+            return Promise.all(sections.map(section => this._loadSection(section)));
+        }
+        if (elements.length === 0) return Promise.resolve();
+
+        return new Promise(resolve => {
+            let first = true;
+            this._shardObserver = new IntersectionObserver((entries) => {
+                const loads = [];
+                for (const entry of entries) {
+                    if (!entry.isIntersecting) continue;
+                    this._shardObserver.unobserve(entry.target);
+                    loads.push(this._loadSection(byId.get(entry.target.dataset.sectionId)));
                 }
-            }
+                if (first) {
+                    first = false;
+                    Promise.all(loads).then(resolve);
+                }
+            }, {
+                root: this._contentEl,
+                rootMargin: '200px'
+            });
+            elements.forEach(el => this._shardObserver.observe(el));
+        });
+    }
+
+    /**
+     * A deep-linked or autoloaded image may be in a section that has not
+     * scrolled into view yet; load the remaining sections to find it.
+     */
+    async _loadLinkedSection(sections) {
+        const wanted = this.autoloadId || this._context?.autoload
+            || new URLSearchParams(window.location.search).get('img');
+        if (!wanted || this._allImages.some(img => img.id === wanted || img.slug === wanted)) return;
+        await Promise.all(sections.map(section => this._loadSection(section)));
+    }
+
+    /**
+     * Fetch a section's shards once and render its images in place.
+     */
+    _loadSection(section) {
+        let load = this._shardLoads.get(section);
+        if (!load) {
+            load = this._loadSectionShards(section).then(() => this._renderLoadedSection(section));
+            this._shardLoads.set(section, load);
         }
+        return load;
+    }
 
-        // Set images on multi-viewer
-        if (this.multiViewer) {
-            this.multiViewer.setImages(this._allImages);
+    /**
+     * Fetch a section's shard files (URLs are relative to the root library file)
+     * and merge their images into section.images in page order. A shard that
+     * fails to load is logged and left out; the others are still shown.
+     */
+    async _loadSectionShards(section) {
+        const base = new URL(this.libraryUrl, window.location.href);
+        const pages = await Promise.allSettled(section.shards.map(async (shard) => {
+            const resp = await fetch(new URL(shard.url, base));
+            if (!resp.ok) throw new Error(`HTTP ${resp.status} loading shard ${shard.url}`);
+            const page = await resp.json();
+            return page.images || [];
+        }));
+        for (const page of pages) {
+            if (page.status === 'rejected') console.error('Error loading library shard:', page.reason);
+        }
+        section.images = pages.flatMap(page => page.status === 'fulfilled' ? page.value : []);
+    }
+
+    /**
+     * Replace a section's index-only element with one listing its images,
+     * keeping whether the reader had it collapsed or open.
+     */
+    _renderLoadedSection(section) {
+        this._collectImages(this.libraryData);
+        const old = this._contentEl.querySelector(`.p360-section[data-section-id="${section.id}"]`);
+        if (!old) return;
+
+        const el = this.renderSection(section);
+        el.classList.toggle('p360-section--collapsed', old.classList.contains('p360-section--collapsed'));
+        const accordion = el.querySelector('.p360-accordion');
+        if (accordion) {
+            accordion.classList.toggle('p360-accordion--open', !!old.querySelector('.p360-accordion--open'));
         }
+        old.replaceWith(el);
+
+        this._observeImages();
+        if (this._currentImageId) this._highlightImage(this._currentImageId);
+    }
+
+    /**
+     * Normalized libraries (build_library.py --normalize) define preset fields
+     * once in data.presets; merge them back into each resolution entry.
+     */
+    _expandPresets(data, image) {
+        if (!data.presets || !image.resolutions) return image;
+        image.resolutions = image.resolutions.map(res => ({ ...data.presets[res.id], ...res }));
+        return image;
+    }
+
+    _processLibraryData(data, { partial = false } = {}) {
+        this.libraryData = data;
+        this._context = data.context || null;
+        this._sections = data.sections || [];
+        this._collectImages(data);
 
         // Apply accent from context if not set via constructor
         if (!this._accent && this._context?.accent) {
@@ -1084,6 +1227,37 @@ class Phong360LibraryUI {
         this._renderSections(this._sections);
         this._renderContext(this._context);
 
+        // Shards still loading: callbacks and URL handling wait for the visible sections
+        if (partial) return;
+
+        this._finishLibraryLoad(data);
+    }
+
+    _collectImages(data) {
+        this._allImages = [];
+
+        // Flatten all images from all sections
+        for (const section of this._sections) {
+            if (section.images) {
+                for (const image of section.images) {
+                    this._allImages.push(this._expandPresets(data, image));
+                }
+            }
+            if (section.items) {
+                // items can also contain images (avatar sections)
+                for (const item of section.items) {
+                    if (item.resolutions) this._allImages.push(this._expandPresets(data, item));
+                }
+            }
+        }
+
+        // Set images on multi-viewer
+        if (this.multiViewer) {
+            this.multiViewer.setImages(this._allImages);
+        }
+    }
+
+    _finishLibraryLoad(data) {
         // Callbacks
         if (this.callbacks.onLibraryLoad) {
             this.callbacks.onLibraryLoad(data);
@@ -1262,11 +1436,11 @@ class Phong360LibraryUI {
                 count.textContent = typeof badgeValue === 'object' ? badgeValue.text : badgeValue;
                 heading.appendChild(count);
             } else {
-                const images = section.images || [];
-                if (images.length > 0) {
+                const imageCount = (section.images || []).length || section.count || 0;
+                if (imageCount > 0) {
                     const count = document.createElement('span');
                     count.className = 'p360-section-heading-count';
-                    count.textContent = images.length;
+                    count.textContent = imageCount;
                     heading.appendChild(count);
                 }
             }
@@ -1509,8 +1683,20 @@ class Phong360LibraryUI {
                 if (entry.isIntersecting) {
                     const img = entry.target;
                     if (img.dataset.src) {
-                        img.src = img.dataset.src;
-                        img.onload = () => img.classList.add('p360-loaded');
+                        const placeholder = this._placeholders.get(img);
+                        const placeholderUrl = placeholder && typeof Phong360MultiImage !== 'undefined'
+                            ? Phong360MultiImage.placeholderUrl(placeholder)
+                            : null;
+                        if (placeholderUrl) {
+                            img.style.background = `center / cover no-repeat url("${placeholderUrl}")`;
+                        }
+                        const sprite = this._sprites.get(img);
+                        if (sprite) {
+                            this._loadSprite(img, sprite, img.dataset.src);
+                        } else {
+                            img.src = img.dataset.src;
+                            img.onload = () => img.classList.add('p360-loaded');
+                        }
                         img.removeAttribute('data-src');
                         this._observer.unobserve(img);
                     }
@@ -1522,6 +1708,47 @@ class Phong360LibraryUI {
         });
     }
 
+    /**
+     * Show a thumbnail straight from its cached sprite atlas: cropped with
+     * object-view-box where supported, otherwise as a background sprite
+     * behind a transparent image of the thumbnail's size. Falls back to the
+     * standalone thumbnail file if the atlas fails to load.
+     */
+    _loadSprite(img, sprite, fallbackUrl) {
+        let atlas = this._atlases.get(sprite.url);
+        if (!atlas) {
+            atlas = new Promise((resolve, reject) => {
+                const image = new Image();
+                image.onload = () => resolve(image);
+                image.onerror = reject;
+                image.src = sprite.url;
+            });
+            this._atlases.set(sprite.url, atlas);
+        }
+
+        img.onload = () => img.classList.add('p360-loaded');
+        atlas.then(image => {
+            const { x, y, width, height } = sprite;
+            const atlasWidth = image.naturalWidth;
+            const atlasHeight = image.naturalHeight;
+            if (typeof CSS !== 'undefined' && CSS.supports('object-view-box', 'inset(0px)')) {
+                img.style.objectViewBox =
+                    `inset(${y}px ${atlasWidth - x - width}px ${atlasHeight - y - height}px ${x}px)`;
+                img.src = sprite.url;
+            } else {
+                // Percentages scale with the rendered size of the thumbnail
+                const offset = (start, size, total) => total > size ? `${start / (total - size) * 100}%` : '0';
+                img.style.background = `url("${sprite.url}") ${offset(x, width, atlasWidth)} ` +
+                    `${offset(y, height, atlasHeight)} / ${atlasWidth / width * 100}% ` +
+                    `${atlasHeight / height * 100}% no-repeat`;
+                img.src = `data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' ` +
+                    `width='${width}' height='${height}'%2F%3E`;
+            }
+        }, () => {
+            img.src = fallbackUrl;
+        });
+    }
+
     _observeImages() {
         if (!this._observer || !this._sidebar) return;
         const images = this._sidebar.querySelectorAll('img[data-src]');
@@ -24,6 +24,10 @@ class Phong360MultiImage {
         this.currentImageData = null;
         this.currentResolution = null;
 
+        // Image formats this browser decodes (AVIF is probed asynchronously)
+        this.supportedFormats = { jpeg: true, webp: false, avif: false };
+        this._detectFormatSupport();
+
         // Load saved resolution preference from localStorage
         this.userPreferredResolution = null;
         try {
@@ -113,8 +117,9 @@ class Phong360MultiImage {
             this.callbacks.onLoadStart();
         }
 
-        const imagePath = this.baseUrl + resolution.path;
-        this.core.loadImage(imagePath, resolution.width, resolution.height);
+        const imagePath = this.baseUrl + this.selectEncoding(resolution).path;
+        const placeholder = Phong360MultiImage.placeholderUrl(imageData.placeholder);
+        this.core.loadImage(imagePath, resolution.width, resolution.height, placeholder);
 
         // Pass full image data object through callback
         if (this.callbacks.onImageLoad) {
@@ -152,6 +157,133 @@ class Phong360MultiImage {
         }
     }
 
+    /**
+     * Pick the smallest encoding of a resolution the browser can decode.
+     * Falls back to the resolution's primary `path` when it lists no encodings.
+     */
+    selectEncoding(resolution) {
+        if (!resolution.encodings || resolution.encodings.length === 0) {
+            return resolution;
+        }
+        const usable = resolution.encodings.filter(e => this.supportedFormats[e.format]);
+        if (usable.length === 0) return resolution;
+        return usable.reduce((best, e) => (e.fileSize < best.fileSize ? e : best));
+    }
+
+    _detectFormatSupport() {
+        try {
+            const canvas = document.createElement('canvas');
+            canvas.width = canvas.height = 1;
+            this.supportedFormats.webp = canvas.toDataURL('image/webp').startsWith('data:image/webp');
+        } catch (e) {
+            // No canvas; keep JPEG only
+        }
+
+        // 1x1 AVIF; browsers without AVIF support fire onerror
+        const probe = new Image();
+        probe.onload = () => { this.supportedFormats.avif = probe.width > 0; };
+        probe.src = 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAADrbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAAB5pbG9jAAAAAEQAAAEAAQAAAAEAAAETAAAAIQAAAChpaW5mAAAAAAABAAAAGmluZmUCAAAAAAEAAGF2MDFDb2xvcgAAAABqaXBycAAAAEtpcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAABdpcG1hAAAAAAAAAAEAAQQBAoMEAAAAKW1kYXQSAAoIGAAGiAhoNCAyExlHh4Yhh5555oAAAJBAyRxhQr4=';
+    }
+
+    /**
+     * Data URL to paint while an image loads: the inline LQIP when the
+     * library has one, otherwise the BlurHash decoded to a tiny canvas.
+     * Returns null when the entry has no placeholder.
+     */
+    static placeholderUrl(placeholder) {
+        if (!placeholder) return null;
+        if (placeholder.lqip) return placeholder.lqip;
+        if (!placeholder.blurhash) return null;
+
+        const cache = Phong360MultiImage._placeholderUrls;
+        if (!cache.has(placeholder.blurhash)) {
+            let url = null;
+            try {
+                const canvas = Phong360MultiImage.decodeBlurHash(
+                    placeholder.blurhash, placeholder.width || 32, placeholder.height || 16
+                );
+                url = canvas.toDataURL();
+            } catch (e) {
+                // Malformed hash or no canvas; go without a placeholder
+            }
+            cache.set(placeholder.blurhash, url);
+        }
+        return cache.get(placeholder.blurhash);
+    }
+
+    /**
+     * Decode a BlurHash string (https://blurha.sh) into a width x height canvas.
+     */
+    static decodeBlurHash(hash, width, height) {
+        const digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+        const decode83 = (str) => {
+            let value = 0;
+            for (const c of str) value = value * 83 + digits.indexOf(c);
+            return value;
+        };
+        const toLinear = (v) => {
+            const x = v / 255;
+            return x <= 0.04045 ? x / 12.92 : Math.pow((x + 0.055) / 1.055, 2.4);
+        };
+        const toSRGB = (v) => {
+            const x = Math.max(0, Math.min(1, v));
+            return x <= 0.0031308
+                ? Math.trunc(x * 12.92 * 255 + 0.5)
+                : Math.trunc((1.055 * Math.pow(x, 1 / 2.4) - 0.055) * 255 + 0.5);
+        };
+        const signPow = (v, exp) => Math.sign(v) * Math.pow(Math.abs(v), exp);
+
+        const sizeFlag = decode83(hash[0]);
+        const numX = (sizeFlag % 9) + 1;
+        const numY = Math.floor(sizeFlag / 9) + 1;
+        if (hash.length !== 4 + 2 * numX * numY) {
+            throw new Error(`Invalid BlurHash length: ${hash}`);
+        }
+        const maxValue = (decode83(hash[1]) + 1) / 166;
+
+        const colors = [];
+        for (let i = 0; i < numX * numY; i++) {
+            if (i === 0) {
+                const dc = decode83(hash.substring(2, 6));
+                colors.push([toLinear(dc >> 16), toLinear((dc >> 8) & 255), toLinear(dc & 255)]);
+            } else {
+                const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+                colors.push([
+                    signPow((Math.floor(ac / 361) - 9) / 9, 2) * maxValue,
+                    signPow((Math.floor(ac / 19) % 19 - 9) / 9, 2) * maxValue,
+                    signPow((ac % 19 - 9) / 9, 2) * maxValue
+                ]);
+            }
+        }
+
+        const canvas = document.createElement('canvas');
+        canvas.width = width;
+        canvas.height = height;
+        const ctx = canvas.getContext('2d');
+        const pixels = ctx.createImageData(width, height);
+        for (let y = 0; y < height; y++) {
+            for (let x = 0; x < width; x++) {
+                let r = 0, g = 0, b = 0;
+                for (let j = 0; j < numY; j++) {
+                    for (let i = 0; i < numX; i++) {
+                        const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height);
+                        const color = colors[i + j * numX];
+                        r += color[0] * basis;
+                        g += color[1] * basis;
+                        b += color[2] * basis;
+                    }
+                }
+                const k = 4 * (x + y * width);
+                pixels.data[k] = toSRGB(r);
+                pixels.data[k + 1] = toSRGB(g);
+                pixels.data[k + 2] = toSRGB(b);
+                pixels.data[k + 3] = 255;
+            }
+        }
+        ctx.putImageData(pixels, 0, 0);
+        return canvas;
+    }
+
     selectOptimalResolution(resolutions) {
         if (!resolutions || resolutions.length === 0) {
             return null;
@@ -235,6 +367,9 @@ class Phong360MultiImage {
     }
 }
 
+// Decoded placeholder data URLs, keyed by BlurHash
+Phong360MultiImage._placeholderUrls = new Map();
+
 // Register globally for script-tag loading
 if (typeof window !== 'undefined') {
     window.Phong360MultiImage = Phong360MultiImage;
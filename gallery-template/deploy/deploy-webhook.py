@@ -3,6 +3,33 @@
 GitHub Webhook Deploy Script for 360 Gallery (Flask)
 Auto-deploys when you push to your repo.
 
+The webhook only verifies the request and queues a deploy job, answering
+202 Accepted right away; a single background worker runs the deploys one
+at a time. Pushes that arrive while a deploy is queued are collapsed into
+one deploy of the newest commit. GET /deploy/status?secret=URL_SECRET
+reports queued, running and recent jobs (add &id=N for a single job).
+
+After each pull the library is rebuilt incrementally: the git diff between
+the old and new HEAD decides whether anything under LIBRARY_ROOT (or the
+config, or the 360-viewer submodule) changed, and if so build_library.py
+re-encodes just the added or modified images, drops outputs of deleted
+ones and atomically replaces library.json.
+
+Ownership is fixed only on what the deploy touched: the files the pull
+changed (in the repo and the viewer submodule) and the outputs the build
+wrote, as listed by build_library.py --changes-file. With RELEASE_MODE the
+site is published as a fresh release directory instead (see
+publish_release()) and CURRENT_LINK is flipped to it atomically.
+
+LOG_FILE gets one JSON object per line. Every deploy step (stash, pull,
+submodule, build, chown, release) is logged as a "step" event with its
+duration, exit code and, for git fetches, the bytes fetched; a "deploy"
+event sums up each job. GET /metrics exposes deploy counts, failures, the
+last success time and step-latency histograms in Prometheus text format.
+It is not proxied by nginx (see step 8), so scrape 127.0.0.1:9000/metrics.
+webhook-harness.py runs the app against a local bare repo instead of
+GitHub.
+
 SERVER SETUP:
   1. Create a deploy user:
      sudo adduser --system --group gallery-deploy
@@ -19,7 +46,9 @@ SERVER SETUP:
      sudo -u gallery-deploy git config --global --add safe.directory /var/www/gallery/360-viewer
 
   4. Install dependencies:
-     pip install flask gunicorn
+     pip install flask gunicorn Pillow tqdm
+     (Pillow and tqdm for the deploy user's python3, which runs the library build)
+     Add library/_BUILD/ to .gitignore: outputs are generated on the server.
 
   5. Generate secrets:
      python3 -c "import secrets; print(secrets.token_hex(32))"
@@ -35,19 +64,31 @@ SERVER SETUP:
 
   7. Run with gunicorn (systemd service recommended):
      gunicorn -w 1 -b 127.0.0.1:9000 deploy-webhook:app
+     Keep it to ONE worker process (-w 1): the job queue lives in memory,
+     and a second process would run deploys in parallel with the first.
 
-  8. Nginx proxy:
+  8. Nginx proxy (leave /metrics local):
      location = /deploy {
          proxy_pass http://127.0.0.1:9000;
          proxy_set_header X-Hub-Signature-256 $http_x_hub_signature_256;
      }
+     location = /deploy/status {
+         proxy_pass http://127.0.0.1:9000;
+     }
 
-  9. Sudoers:
-     echo 'www-data ALL=(gallery-deploy) NOPASSWD: /usr/bin/git' | sudo tee /etc/sudoers.d/gallery-deploy
+  9. Sudoers (git, plus python3 running the library builder):
+     echo 'www-data ALL=(gallery-deploy) NOPASSWD: /usr/bin/git, /usr/bin/python3 /var/www/gallery/360-viewer/library/build_library.py *' | sudo tee /etc/sudoers.d/gallery-deploy
+
+  10. Optional release mode (RELEASE_MODE = True): point the web server's
+      root at CURRENT_LINK instead of DEPLOY_DIR, and let it follow symlinks
+      (nginx does by default). Each deploy copies the site, without source
+      images, into RELEASES_DIR/<time>-<commit> and flips the link. The
+      build dir is snapshotted with hard links, so keep RELEASES_DIR on the
+      same filesystem as DEPLOY_DIR (otherwise it is copied in full).
 
 IMPORTANT GOTCHAS:
   - The .git directories must be owned by the deploy user, NOT www-data
-  - After chowning web files, restore .git ownership to deploy user
+  - Only changed paths are chowned; never chown the .git directories
   - safe.directory must be set for BOTH the main repo and the 360-viewer submodule
   - Use pull.ff only to prevent merge commits on deploy
 """
@@ -56,7 +97,13 @@ import hashlib
 import hmac
 import json
 import logging
+import os
+import shutil
 import subprocess
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from flask import Flask, request, jsonify
 
 # ============================================================
@@ -68,26 +115,152 @@ DEPLOY_DIR = '/var/www/gallery'
 DEPLOY_USER = 'gallery-deploy'
 BRANCH = 'master'  # or 'main'
 LOG_FILE = '/var/log/gallery-deploy.log'
+JOB_HISTORY = 50  # finished jobs kept for /deploy/status
+
+# Library rebuild after each pull (paths relative to DEPLOY_DIR)
+PYTHON = '/usr/bin/python3'
+VIEWER_DIR = '360-viewer'  # the viewer submodule
+BUILDER = f'{VIEWER_DIR}/library/build_library.py'
+LIBRARY_ROOT = 'library'
+LIBRARY_OUTPUT = 'library/library.json'
+VIEWER_CONFIG = '360-viewer.json'
+BUILD_ARGS = ['--jobs', '0']  # extra build_library.py flags, e.g. '--hashed-names'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')  # what build_library.py picks up
+BUILD_DIR = '_BUILD'  # build.outputDir in 360-viewer.json
+CHANGES_FILE = f'{LIBRARY_ROOT}/{BUILD_DIR}/.deploy-changes.json'
+WEB_OWNER = 'www-data:www-data'
+
+# Release mode: publish each deploy as a new directory and flip a symlink
+RELEASE_MODE = False
+RELEASES_DIR = '/var/www/gallery-releases'
+CURRENT_LINK = '/var/www/gallery-current'  # web server root in release mode
+KEEP_RELEASES = 5
+
+# Upper bounds (seconds) of the step and deploy latency histograms in /metrics
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
 
 app = Flask(__name__)
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format='[%(asctime)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-
-def run_as(user, cmd, cwd=DEPLOY_DIR):
+# Deploy queue: at most one job waits while another runs. A push that
+# arrives while a job is still queued replaces it ("superseded"), since
+# pulling the branch deploys its newest commit anyway.
+jobs = OrderedDict()
+queued_job = None
+running_job = None
+next_job_id = 1
+queue_lock = threading.Condition()
+worker = None
+
+# /metrics state: finished jobs by result, and latency histograms
+# ({'buckets': [...], 'sum': s, 'count': n}) per step and per deploy
+metrics_lock = threading.Lock()
+metrics = {
+    'deploys': {'success': 0, 'failed': 0, 'superseded': 0},
+    'last_success': None,
+    'fetched_bytes': 0,
+    'step_failures': {},
+    'steps': {},
+    'duration': None
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message and the record's event fields."""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)),
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+# delay=True: nothing is opened if logging was configured before import
+# (as webhook-harness.py does)
+log_handler = logging.FileHandler(LOG_FILE, delay=True)
+log_handler.setFormatter(JsonFormatter())
+logging.basicConfig(level=logging.INFO, handlers=[log_handler])
+
+
+def log_event(event, message, level=logging.INFO, **fields):
+    """Log a structured event; `fields` become keys of its JSON line."""
+    logging.log(level, message, extra={'fields': {'event': event, **fields}})
+
+
+def observe(histogram, seconds):
+    """Add a sample to a latency histogram (None starts a new one)."""
+    if histogram is None:
+        histogram = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            histogram['buckets'][i] += 1
+    histogram['sum'] += seconds
+    histogram['count'] += 1
+    return histogram
+
+
+def run_as(user, cmd, cwd=None):
     """Run a git command as the deploy user."""
     result = subprocess.run(
         ['sudo', '-u', user] + cmd,
-        cwd=cwd, capture_output=True, text=True
+        cwd=cwd or DEPLOY_DIR, capture_output=True, text=True
     )
     return result.returncode, result.stdout + result.stderr
 
 
+def object_bytes(cwd=None):
+    """Size of a repository's object store, from `git count-objects -v`."""
+    ret, out = run_as(DEPLOY_USER, ['git', 'count-objects', '-v'], cwd=cwd)
+    if ret != 0:
+        return None
+    sizes = dict(line.split(': ', 1) for line in out.splitlines() if ': ' in line)
+    return (int(sizes.get('size', 0)) + int(sizes.get('size-pack', 0))) * 1024
+
+
+@contextmanager
+def deploy_step(job, name):
+    """Time one step of a deploy job; the body sets 'exitCode' (and extra fields) on the yielded dict.
+
+    The step is added to job['steps'] and to the /metrics histograms, and
+    logged as a "step" event.
+    """
+    step = {'step': name, 'exitCode': None}
+    started = time.time()
+    try:
+        yield step
+    finally:
+        step['seconds'] = round(time.time() - started, 3)
+        failed = step['exitCode'] not in (0, None)
+        with metrics_lock:
+            metrics['steps'][name] = observe(metrics['steps'].get(name), step['seconds'])
+            if failed:
+                metrics['step_failures'][name] = metrics['step_failures'].get(name, 0) + 1
+            metrics['fetched_bytes'] += step.get('bytesFetched') or 0
+        job['steps'].append(step)
+        log_event('step', f"{name}: exit {step['exitCode']} after {step['seconds']:.2f}s",
+                  level=logging.WARNING if failed else logging.INFO, job=job['id'], **step)
+
+
+def run_step(job, name, cmd, cwd=None, objects=None):
+    """Run a command as the deploy user as a timed step; returns (exit code, output).
+
+    With `objects` (a repository path), the growth of its object store is
+    recorded as bytesFetched.
+    """
+    with deploy_step(job, name) as step:
+        before = object_bytes(objects) if objects else None
+        ret, out = run_as(DEPLOY_USER, cmd, cwd=cwd)
+        step['exitCode'] = ret
+        if before is not None:
+            after = object_bytes(objects)
+            step['bytesFetched'] = max(after - before, 0) if after is not None else None
+    return ret, out
+
+
 def verify_signature(payload, signature):
     """Verify GitHub webhook HMAC-SHA256 signature."""
     if not signature:
@@ -98,6 +271,310 @@ def verify_signature(payload, signature):
     return hmac.compare_digest(expected, signature)
 
 
+def git_head(cwd=None):
+    ret, out = run_as(DEPLOY_USER, ['git', 'rev-parse', 'HEAD'], cwd=cwd)
+    return out.strip() if ret == 0 else None
+
+
+def changed_paths(old, new, cwd=None):
+    """(status, path) pairs from `git diff --name-status` between two commits."""
+    if not old or not new:
+        return None
+    ret, out = run_as(DEPLOY_USER, ['git', 'diff', '--name-status', '--no-renames', '-z', old, new], cwd=cwd)
+    if ret != 0:
+        return None
+    fields = out.split('\0')
+    return [(fields[i][:1], fields[i + 1]) for i in range(0, len(fields) - 1, 2)]
+
+
+def rebuild_library(job, changes):
+    """Rebuild library.json if the pull touched images, the config or the viewer.
+
+    `changes` is the changed_paths() of the pull, or None when unknown; the
+    build runs as the "build" step of `job`.
+    Returns (ok, summary, outputs): build_library.py's own build cache
+    makes the rebuild incremental, so only added or modified images are
+    re-encoded and outputs of deleted ones are removed. `outputs` is its
+    --changes-file report, or None when nothing was built.
+    """
+    if changes is None:
+        reason = 'no previous HEAD to diff against'
+    else:
+        images = {'A': 0, 'M': 0, 'D': 0}
+        other = False
+        for status, path in changes:
+            parts = path.split('/')
+            if (parts[0] == LIBRARY_ROOT and BUILD_DIR not in parts
+                    and path.lower().endswith(IMAGE_EXTENSIONS)):
+                images[status if status in images else 'M'] += 1
+            elif path == VIEWER_CONFIG or parts[0] == VIEWER_DIR:
+                other = True
+        reason = f"{images['A']} added, {images['M']} modified, {images['D']} deleted image(s)"
+        if not any(images.values()) and not other:
+            if os.path.exists(os.path.join(DEPLOY_DIR, LIBRARY_OUTPUT)):
+                return True, 'library unchanged', None
+            reason = f'{LIBRARY_OUTPUT} missing'
+        elif other:
+            reason += ', config or viewer changed'
+
+    logging.info(f'Rebuilding library: {reason}')
+    started = time.time()
+    ret, out = run_step(job, 'build', [
+        PYTHON, os.path.join(DEPLOY_DIR, BUILDER),
+        '--root', LIBRARY_ROOT,
+        '--output', LIBRARY_OUTPUT,
+        '--config', VIEWER_CONFIG,
+        '--changes-file', CHANGES_FILE
+    ] + BUILD_ARGS)
+    if ret != 0:
+        logging.error(f'Library build failed: {out}')
+        return False, f'library build failed ({reason}): {out.strip()[-2000:]}', None
+    try:
+        with open(os.path.join(DEPLOY_DIR, CHANGES_FILE)) as f:
+            outputs = json.load(f)
+    except (OSError, ValueError):
+        outputs = None
+    return True, f'library rebuilt in {time.time() - started:.1f}s ({reason})', outputs
+
+
+def fix_ownership(paths, recursive=(), root=None):
+    """chown the given paths (relative to `root`) to WEB_OWNER, and nothing else.
+
+    `recursive` paths (tile pyramids, shard folders) are chowned with -R.
+    Paths that no longer exist are skipped; arguments go in batches.
+    Returns (path count, exit code of the first failed chown or 0).
+    """
+    root = root or DEPLOY_DIR
+    exit_code = 0
+    for flags, batch in (([], paths), (['-R'], recursive)):
+        existing = sorted(p for p in set(batch) if os.path.lexists(os.path.join(root, p)))
+        for i in range(0, len(existing), 500):
+            result = subprocess.run(['chown'] + flags + [WEB_OWNER, '--'] + existing[i:i + 500],
+                                    cwd=root, capture_output=True, text=True)
+            if result.returncode != 0:
+                logging.error(f'chown failed: {result.stderr.strip()[-2000:]}')
+                exit_code = exit_code or result.returncode
+    return len(set(paths)) + len(set(recursive)), exit_code
+
+
+def pulled_paths(changes, prefix=''):
+    """Added or modified paths from changed_paths(), plus their parent directories."""
+    paths = set()
+    for status, path in changes or []:
+        if status == 'D':
+            continue
+        path = prefix + path
+        paths.add(path)
+        parent = os.path.dirname(path)
+        while parent:
+            paths.add(parent)
+            parent = os.path.dirname(parent)
+    return paths
+
+
+def output_paths(outputs):
+    """(files, directories) written by the build, relative to DEPLOY_DIR."""
+    files, directories = set(), set()
+    if not outputs:
+        return files, directories
+    for path in outputs['written']:
+        path = os.path.join(LIBRARY_ROOT, path)
+        (directories if os.path.isdir(os.path.join(DEPLOY_DIR, path)) else files).add(path)
+    for path in outputs['library']:
+        (directories if os.path.isdir(os.path.join(DEPLOY_DIR, path)) else files).add(path)
+    return files, directories
+
+
+def link_or_copy(src, dst):
+    """Hard-link a file, or copy it when RELEASES_DIR is on another filesystem."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def publish_release(head):
+    """Copy the site into a new release directory and atomically point CURRENT_LINK at it.
+
+    Source images are left out and the build dir is snapshotted with hard
+    links, so the copy (and its chown) is bounded by the size of the site
+    files, not of the gallery. build_library.py replaces outputs by rename
+    and prunes them by unlinking, so later builds never change a release's
+    snapshot, and rolling back to an older release is safe. Old releases
+    beyond KEEP_RELEASES are deleted.
+    """
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{(head or 'unknown')[:7]}"
+    release = os.path.join(RELEASES_DIR, name)
+    library_root = os.path.join(DEPLOY_DIR, LIBRARY_ROOT)
+    shards = os.path.basename(os.path.splitext(LIBRARY_OUTPUT)[0]) + '-shards'
+
+    def ignore(directory, names):
+        skipped = {'.git'} & set(names)
+        if os.path.abspath(directory) == os.path.abspath(library_root):
+            for entry in names:
+                full_path = os.path.join(directory, entry)
+                if (os.path.isdir(full_path) and entry != shards) or entry.lower().endswith(IMAGE_EXTENSIONS):
+                    skipped.add(entry)
+        return skipped
+
+    os.makedirs(RELEASES_DIR, exist_ok=True)
+    shutil.copytree(DEPLOY_DIR, release, symlinks=True, ignore=ignore)
+    result = subprocess.run(['chown', '-R', '-h', WEB_OWNER, release], capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f'chown of release {name} failed: {result.stderr.strip()[-2000:]}')
+    # Snapshot the outputs after the chown, which would otherwise reach the
+    # checkout's files through the links; dotfiles are build state, not site files
+    shutil.copytree(os.path.join(library_root, BUILD_DIR), os.path.join(release, LIBRARY_ROOT, BUILD_DIR),
+                    ignore=shutil.ignore_patterns('.*'), copy_function=link_or_copy)
+
+    # Replace the link in one rename so the web server never sees it missing
+    tmp_link = f'{CURRENT_LINK}.tmp'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(release, tmp_link)
+    os.replace(tmp_link, CURRENT_LINK)
+
+    current = os.path.realpath(CURRENT_LINK)
+    for old in sorted(os.listdir(RELEASES_DIR))[:-KEEP_RELEASES]:
+        old_path = os.path.join(RELEASES_DIR, old)
+        if os.path.realpath(old_path) != current:
+            shutil.rmtree(old_path)
+    return name, result.returncode
+
+
+def run_deploy(job):
+    """Pull the branch, update the submodule, rebuild the library and fix ownership. Returns (ok, message).
+
+    Each step is timed and recorded in job['steps'] (see deploy_step()).
+    """
+    viewer_dir = os.path.join(DEPLOY_DIR, VIEWER_DIR)
+    has_viewer = os.path.exists(os.path.join(viewer_dir, '.git'))
+    old_head = git_head()
+    old_viewer = git_head(viewer_dir) if has_viewer else None
+
+    # Stash local changes
+    run_step(job, 'stash', ['git', 'stash'])
+
+    # Pull latest
+    ret, out = run_step(job, 'pull', ['git', 'pull', 'origin', BRANCH, '--force'], objects=DEPLOY_DIR)
+    if ret != 0:
+        logging.error(f'Git pull failed: {out}')
+        return False, f'git pull failed: {out.strip()}'
+
+    # Update submodule
+    ret, out = run_step(job, 'submodule', ['git', 'submodule', 'update', '--init', '--recursive'],
+                        objects=viewer_dir if has_viewer else None)
+    if ret != 0:
+        logging.warning(f'Submodule update issue: {out}')
+
+    new_head = git_head()
+    changes = changed_paths(old_head, new_head)
+    built, summary, outputs = rebuild_library(job, changes)
+
+    # Fix ownership of what this deploy touched, not the whole tree
+    files, directories = output_paths(outputs)
+    if not RELEASE_MODE:
+        # Served straight from the checkout, so pulled files count too
+        files |= pulled_paths(changes)
+        if old_viewer:
+            files |= pulled_paths(changed_paths(old_viewer, git_head(viewer_dir), cwd=viewer_dir), f'{VIEWER_DIR}/')
+    with deploy_step(job, 'chown') as step:
+        step['paths'], step['exitCode'] = fix_ownership(files, directories)
+    logging.info(f"Fixed ownership of {step['paths']} path(s)")
+
+    if not built:
+        return False, summary
+    if RELEASE_MODE:
+        with deploy_step(job, 'release') as step:
+            step['release'], step['exitCode'] = publish_release(new_head)
+        summary += f"; released {step['release']}"
+    logging.info(f"SUCCESS: Deployed '{job['message']}' by {job['who']}: {summary}")
+    return True, f'deployed; {summary}'
+
+
+def deploy_worker():
+    """Run queued deploy jobs one at a time, forever."""
+    global queued_job, running_job
+    while True:
+        with queue_lock:
+            while queued_job is None:
+                queue_lock.wait()
+            job, queued_job = queued_job, None
+            running_job = job
+            job['status'] = 'running'
+            job['started'] = time.time()
+
+        log_event('start', f"Deploying commit {job['commit']} (job {job['id']})", job=job['id'], commit=job['commit'])
+        try:
+            ok, detail = run_deploy(job)
+        except Exception as e:
+            logging.exception(f"Deploy job {job['id']} crashed")
+            ok, detail = False, str(e)
+
+        with queue_lock:
+            job['status'] = 'success' if ok else 'failed'
+            job['detail'] = detail
+            job['finished'] = time.time()
+            running_job = None
+
+        seconds = job['finished'] - job['started']
+        with metrics_lock:
+            metrics['deploys'][job['status']] += 1
+            metrics['duration'] = observe(metrics['duration'], seconds)
+            if ok:
+                metrics['last_success'] = job['finished']
+        log_event('deploy', f"Job {job['id']} {job['status']} after {seconds:.1f}s",
+                  level=logging.INFO if ok else logging.ERROR,
+                  job=job['id'], commit=job['commit'], status=job['status'], seconds=round(seconds, 3),
+                  queuedSeconds=round(job['started'] - job['queued'], 3),
+                  steps={step['step']: step['seconds'] for step in job['steps']},
+                  bytesFetched=sum(step.get('bytesFetched') or 0 for step in job['steps']))
+
+
+def enqueue_deploy(data):
+    """Queue a deploy for a push payload, superseding a job that has not started yet."""
+    global queued_job, next_job_id, worker
+    head = data.get('head_commit') or {}
+    with queue_lock:
+        job = {
+            'id': next_job_id,
+            'status': 'queued',
+            'commit': data.get('after', '')[:7],
+            'message': head.get('message', 'unknown'),
+            'who': head.get('committer', {}).get('name', 'unknown'),
+            'queued': time.time(),
+            'started': None,
+            'finished': None,
+            'detail': None,
+            'steps': []
+        }
+        next_job_id += 1
+        if queued_job is not None:
+            queued_job['status'] = 'superseded'
+            queued_job['detail'] = f"superseded by job {job['id']}"
+            queued_job['finished'] = time.time()
+            with metrics_lock:
+                metrics['deploys']['superseded'] += 1
+            log_event('superseded', f"Job {queued_job['id']} ({queued_job['commit']}) superseded by job {job['id']}",
+                      job=queued_job['id'], commit=queued_job['commit'], by=job['id'])
+        queued_job = job
+        jobs[job['id']] = job
+        # Forget the oldest finished jobs
+        while len(jobs) > JOB_HISTORY:
+            oldest = next(iter(jobs.values()))
+            if oldest['status'] in ('queued', 'running'):
+                break
+            jobs.popitem(last=False)
+
+        # Started on first use rather than at import, so it lives in the
+        # gunicorn worker process and not in the forking master
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(target=deploy_worker, name='deploy-worker', daemon=True)
+            worker.start()
+        queue_lock.notify()
+    return job
+
+
 @app.route('/deploy', methods=['POST'])
 def deploy():
     # URL secret check
@@ -125,33 +602,76 @@ def deploy():
         logging.info(f'Ignoring push to {ref}')
         return 'Ignored'
 
-    commit = data.get('after', '')[:7]
-    logging.info(f'Deploying commit {commit}')
+    job = enqueue_deploy(data)
+    log_event('queued', f"Queued deploy of commit {job['commit']} as job {job['id']}", job=job['id'], commit=job['commit'])
+    return jsonify({'status': 'queued', 'job': job['id'], 'commit': job['commit']}), 202
 
-    # Stash local changes
-    run_as(DEPLOY_USER, ['git', 'stash'])
 
-    # Pull latest
-    ret, out = run_as(DEPLOY_USER, ['git', 'pull', 'origin', BRANCH, '--force'])
-    if ret != 0:
-        logging.error(f'Git pull failed: {out}')
-        return 'Deploy failed', 500
-
-    # Update submodule
-    ret, out = run_as(DEPLOY_USER, ['git', 'submodule', 'update', '--init', '--recursive'])
-    if ret != 0:
-        logging.warning(f'Submodule update issue: {out}')
-
-    # Fix ownership
-    subprocess.run(['chown', '-R', 'www-data:www-data', DEPLOY_DIR])
-    subprocess.run(['chown', '-R', f'{DEPLOY_USER}:{DEPLOY_USER}',
-                     f'{DEPLOY_DIR}/.git', f'{DEPLOY_DIR}/360-viewer/.git'])
-
-    msg = data.get('head_commit', {}).get('message', 'unknown')
-    who = data.get('head_commit', {}).get('committer', {}).get('name', 'unknown')
-    logging.info(f"SUCCESS: Deployed '{msg}' by {who}")
+@app.route('/deploy/status', methods=['GET'])
+def deploy_status():
+    if request.args.get('secret') != URL_SECRET:
+        return 'Unauthorized', 401
 
-    return jsonify({'status': 'success', 'commit': commit})
+    with queue_lock:
+        job_id = request.args.get('id', type=int)
+        if job_id is not None:
+            if job_id not in jobs:
+                return jsonify({'error': f'unknown job {job_id}'}), 404
+            return jsonify(dict(jobs[job_id]))
+        return jsonify({
+            'running': dict(running_job) if running_job else None,
+            'queued': dict(queued_job) if queued_job else None,
+            'jobs': [dict(job) for job in reversed(jobs.values())]
+        })
+
+
+@app.route('/metrics', methods=['GET'])
+def deploy_metrics():
+    """Deploy counters and latency histograms in Prometheus text format."""
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    def sample(name, labels, value):
+        label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+    def histogram(name, labels, data):
+        for bound, count in zip(LATENCY_BUCKETS, data['buckets']):
+            sample(f'{name}_bucket', {**labels, 'le': f'{bound:g}'}, count)
+        sample(f'{name}_bucket', {**labels, 'le': '+Inf'}, data['count'])
+        sample(f'{name}_sum', labels, round(data['sum'], 3))
+        sample(f'{name}_count', labels, data['count'])
+
+    with metrics_lock:
+        header('gallery_deploys_total', 'counter', 'Finished deploy jobs by result.')
+        for result, count in metrics['deploys'].items():
+            sample('gallery_deploys_total', {'result': result}, count)
+        header('gallery_deploy_failures_total', 'counter', 'Deploy jobs that failed.')
+        sample('gallery_deploy_failures_total', {}, metrics['deploys']['failed'])
+        header('gallery_deploy_last_success_timestamp_seconds', 'gauge',
+               'Unix time the last successful deploy finished (0 if none yet).')
+        sample('gallery_deploy_last_success_timestamp_seconds', {}, round(metrics['last_success'] or 0, 3))
+        header('gallery_deploy_fetched_bytes_total', 'counter',
+               'Bytes added to the object stores by git pull and submodule update.')
+        sample('gallery_deploy_fetched_bytes_total', {}, metrics['fetched_bytes'])
+        header('gallery_deploy_step_failures_total', 'counter', 'Deploy steps that exited non-zero.')
+        for step, count in sorted(metrics['step_failures'].items()):
+            sample('gallery_deploy_step_failures_total', {'step': step}, count)
+        header('gallery_deploy_step_duration_seconds', 'histogram', 'Duration of each deploy step.')
+        for step, data in sorted(metrics['steps'].items()):
+            histogram('gallery_deploy_step_duration_seconds', {'step': step}, data)
+        if metrics['duration']:
+            header('gallery_deploy_duration_seconds', 'histogram', 'Duration of whole deploy jobs.')
+            histogram('gallery_deploy_duration_seconds', {}, metrics['duration'])
+    with queue_lock:
+        header('gallery_deploy_jobs', 'gauge', 'Deploy jobs waiting or running.')
+        sample('gallery_deploy_jobs', {'state': 'queued'}, int(queued_job is not None))
+        sample('gallery_deploy_jobs', {'state': 'running'}, int(running_job is not None))
+
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 
 if __name__ == '__main__':
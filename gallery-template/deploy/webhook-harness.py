@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Local test harness for deploy-webhook.py
+Runs the Flask app against a local bare git repository standing in for
+GitHub, so deploys, logs and metrics can be checked without a server.
+
+- Creates a bare "origin" repo, a working clone that pushes commits, and a
+  deploy checkout (DEPLOY_DIR) cloned from origin, all in a temp directory
+- Commits small generated panoramas and sends signed push payloads through
+  Flask's test client, then waits for the background deploy worker
+- Checks a good deploy (library rebuilt, bytes fetched), a bad signature,
+  a push to another branch and a failing pull
+- Holds the worker on a running deploy while two more pushes arrive, and
+  checks the first is superseded and the newest commit is deployed
+- Checks that a failing chown is recorded on its step
+- Deploys twice in release mode, then checks the older release's outputs
+  survived the second build and that rolling back to it serves a complete
+  library
+- Finally checks the JSON log lines and the /metrics output
+
+Commands run as the current user instead of `sudo -u DEPLOY_USER`, and
+WEB_OWNER is set to the current user so chown needs no privileges.
+
+Usage:
+    python webhook-harness.py
+    python webhook-harness.py --keep --builder ../../360-viewer/library/build_library.py
+"""
+
+import os
+import sys
+import json
+import hmac
+import time
+import hashlib
+import logging
+import shutil
+import subprocess
+import tempfile
+import argparse
+import threading
+import importlib.util
+
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEBHOOK = os.path.join(HERE, 'deploy-webhook.py')
+# The viewer repo's builder when run from gallery-template/deploy in this repo
+DEFAULT_BUILDER = os.path.join(HERE, '..', '..', 'library', 'build_library.py')
+
+BRANCH = 'master'
+WEBHOOK_SECRET = 'harness-webhook-secret'
+URL_SECRET = 'harness-url-secret'
+
+# Cleared to hold the deploy worker at its next command
+gate = threading.Event()
+gate.set()
+
+
+def git(cwd, *args):
+    """Run git with a fixed identity; returns stdout, raising on failure."""
+    result = subprocess.run(
+        ['git', '-c', 'user.name=Harness', '-c', 'user.email=harness@localhost'] + list(args),
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def run_local(user, cmd, cwd=None):
+    """Stand-in for deploy-webhook's run_as(): no sudo, same return value; waits while `gate` is cleared."""
+    gate.wait()
+    result = subprocess.run(cmd, cwd=cwd or webhook.DEPLOY_DIR, capture_output=True, text=True)
+    return result.returncode, result.stdout + result.stderr
+
+
+def make_panorama(path, seed):
+    """A small 2:1 gradient, large enough for the 2K preset."""
+    img = Image.linear_gradient('L').resize((2048, 1024)).convert('RGB')
+    img = Image.merge('RGB', [band.point(lambda v, k=k: (v + seed * 40 * k) % 256) for k, band in enumerate(img.split())])
+    img.save(path, quality=85)
+
+
+def commit_image(work_dir, name, seed, message, remove=()):
+    """Add (or replace) a panorama in the working clone, delete the `remove` ones,
+    and push it to origin; returns the commit sha."""
+    os.makedirs(os.path.join(work_dir, 'library', 'Harness'), exist_ok=True)
+    make_panorama(os.path.join(work_dir, 'library', 'Harness', name), seed)
+    for old in remove:
+        os.remove(os.path.join(work_dir, 'library', 'Harness', old))
+    git(work_dir, 'add', '-A')
+    git(work_dir, 'commit', '-q', '-m', message)
+    git(work_dir, 'push', '-q', 'origin', BRANCH)
+    return git(work_dir, 'rev-parse', 'HEAD')
+
+
+def push_payload(sha, message, ref=f'refs/heads/{BRANCH}'):
+    return {
+        'ref': ref,
+        'after': sha,
+        'head_commit': {'message': message, 'committer': {'name': 'Harness'}}
+    }
+
+
+def post_push(client, payload, secret=WEBHOOK_SECRET):
+    body = json.dumps(payload).encode()
+    signature = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(
+        f'/deploy?secret={URL_SECRET}', data=body,
+        headers={'Content-Type': 'application/json', 'X-Hub-Signature-256': signature}
+    )
+
+
+def wait_for_job(client, job_id, timeout, pending=('queued', 'running')):
+    """Poll /deploy/status until the job has left the `pending` states; returns it."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/deploy/status?secret={URL_SECRET}&id={job_id}').get_json()
+        if job['status'] not in pending:
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(f'job {job_id} did not leave {"/".join(pending)} within {timeout}s')
+
+
+def library_images(site_dir):
+    """Images listed by a site's library.json, or 0 when it is missing or unreadable."""
+    try:
+        with open(os.path.join(site_dir, webhook.LIBRARY_OUTPUT)) as f:
+            library = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    return sum(len(section['images']) for section in library['sections'])
+
+
+def library_paths(site_dir):
+    """Output paths (relative to the library root) that a site's library.json references."""
+    with open(os.path.join(site_dir, webhook.LIBRARY_OUTPUT)) as f:
+        library = json.load(f)
+    paths = []
+    for section in library['sections']:
+        for image in section['images']:
+            paths += [image['thumbnail']['path']] if image.get('thumbnail') else []
+            paths += [resolution['path'] for resolution in image.get('resolutions', [])]
+    return paths
+
+
+def build_outputs(site_dir):
+    """{path: (is symlink, contents)} for the files in a site's build dir, build state dotfiles aside."""
+    build_dir = os.path.join(site_dir, webhook.LIBRARY_ROOT, webhook.BUILD_DIR)
+    outputs = {}
+    for directory, dirs, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(directory, name)
+            if not name.startswith('.'):
+                with open(path, 'rb') as f:
+                    outputs[os.path.relpath(path, build_dir)] = (os.path.islink(path), f.read())
+    return outputs
+
+
+def main():
+    global webhook
+    parser = argparse.ArgumentParser(
+        description='Run deploy-webhook.py against a local bare git repo'
+    )
+    parser.add_argument('--builder', default=DEFAULT_BUILDER,
+                        help='build_library.py to run after each pull (default: this repo\'s)')
+    parser.add_argument('--timeout', type=float, default=120.0, metavar='SECONDS',
+                        help='How long to wait for each deploy (default: 120)')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the temporary repos and log instead of deleting them')
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix='webhook-harness-')
+    origin = os.path.join(base, 'origin.git')
+    work_dir = os.path.join(base, 'work')
+    deploy_dir = os.path.join(base, 'site')
+    log_file = os.path.join(base, 'deploy.log')
+
+    # Configured before import, so the webhook's basicConfig() is a no-op
+    # and nothing is written to /var/log
+    logging.basicConfig(filename=log_file, level=logging.INFO)
+    spec = importlib.util.spec_from_file_location('deploy_webhook', WEBHOOK)
+    webhook = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(webhook)
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(webhook.JsonFormatter())
+
+    webhook.WEBHOOK_SECRET = WEBHOOK_SECRET
+    webhook.URL_SECRET = URL_SECRET
+    webhook.DEPLOY_DIR = deploy_dir
+    webhook.BRANCH = BRANCH
+    webhook.PYTHON = sys.executable
+    webhook.BUILDER = os.path.abspath(args.builder)
+    webhook.BUILD_ARGS = ['--jobs', '1']
+    webhook.WEB_OWNER = f'{os.getuid()}:{os.getgid()}'
+    webhook.run_as = run_local
+
+    failures = []
+    finished = []
+
+    def check(condition, label):
+        print(f"  [{'PASS' if condition else 'FAIL'}] {label}")
+        if not condition:
+            failures.append(label)
+
+    try:
+        print(f"Harness directory: {base}")
+        git(base, 'init', '-q', '--bare', f'--initial-branch={BRANCH}', origin)
+        git(base, 'clone', '-q', origin, work_dir)
+        git(work_dir, 'checkout', '-q', '-b', BRANCH)
+        with open(os.path.join(work_dir, '.gitignore'), 'w') as f:
+            f.write('library/_BUILD/\nlibrary/library.json\n')
+        commit_image(work_dir, 'first.jpg', 1, 'Add first panorama')
+        git(base, 'clone', '-q', '--branch', BRANCH, origin, deploy_dir)
+
+        client = webhook.app.test_client()
+
+        print("\nDeploy of a new image:")
+        sha = commit_image(work_dir, 'second.jpg', 2, 'Add second panorama')
+        response = post_push(client, push_payload(sha, 'Add second panorama'))
+        check(response.status_code == 202, f'push answered 202 (got {response.status_code})')
+        job = wait_for_job(client, response.get_json()['job'], args.timeout)
+        finished.append(job)
+        check(job['status'] == 'success', f"job succeeded ({job['status']}: {job['detail']})")
+        steps = {step['step']: step for step in job['steps']}
+        check(['stash', 'pull', 'submodule', 'build', 'chown'] == list(steps),
+              f"steps recorded in order ({', '.join(steps)})")
+        check((steps.get('pull', {}).get('bytesFetched') or 0) > 0, 'pull fetched bytes')
+        check(all(step['exitCode'] == 0 for step in job['steps']), 'every step exited 0')
+        images = library_images(deploy_dir)
+        check(images == 2, f'library.json lists both images ({images})')
+
+        print("\nRejected requests:")
+        response = post_push(client, push_payload(sha, 'bad'), secret='wrong-secret')
+        check(response.status_code == 401, f'bad signature answered 401 (got {response.status_code})')
+        response = post_push(client, push_payload(sha, 'other', ref='refs/heads/feature'))
+        check(response.get_data(as_text=True) == 'Ignored', 'push to another branch ignored')
+
+        print("\nFailing pull:")
+        git(deploy_dir, 'remote', 'set-url', 'origin', os.path.join(base, 'missing.git'))
+        response = post_push(client, push_payload(sha, 'Unreachable origin'))
+        job = wait_for_job(client, response.get_json()['job'], args.timeout)
+        finished.append(job)
+        pull = next((step for step in job['steps'] if step['step'] == 'pull'), {})
+        check(job['status'] == 'failed', f"job failed ({job['status']})")
+        check(pull.get('exitCode') not in (0, None), f"pull exit code recorded ({pull.get('exitCode')})")
+        git(deploy_dir, 'remote', 'set-url', 'origin', origin)
+
+        print("\nCoalesced pushes:")
+        gate.clear()
+        sha = commit_image(work_dir, 'third.jpg', 3, 'Add third panorama')
+        running = post_push(client, push_payload(sha, 'Add third panorama')).get_json()['job']
+        wait_for_job(client, running, args.timeout, pending=('queued',))
+        sha = commit_image(work_dir, 'fourth.jpg', 4, 'Add fourth panorama')
+        superseded = post_push(client, push_payload(sha, 'Add fourth panorama')).get_json()['job']
+        sha = commit_image(work_dir, 'fifth.jpg', 5, 'Add fifth panorama')
+        newest = post_push(client, push_payload(sha, 'Add fifth panorama')).get_json()['job']
+        gate.set()
+        job = wait_for_job(client, superseded, args.timeout)
+        check(job['status'] == 'superseded' and not job['steps'],
+              f"queued job superseded without running ({job['status']}, {len(job['steps'])} steps)")
+        check(job['detail'] == f'superseded by job {newest}', f"superseded by the newest push ({job['detail']})")
+        for job_id in (running, newest):
+            job = wait_for_job(client, job_id, args.timeout)
+            finished.append(job)
+            check(job['status'] == 'success', f"job {job_id} succeeded ({job['status']}: {job['detail']})")
+        check(git(deploy_dir, 'rev-parse', 'HEAD') == sha, 'checkout is at the newest commit')
+        images = library_images(deploy_dir)
+        check(images == 5, f'library.json lists all five images ({images})')
+
+        print("\nFailing chown:")
+        webhook.WEB_OWNER = 'harness-no-such-user'
+        sha = commit_image(work_dir, 'sixth.jpg', 6, 'Add sixth panorama')
+        response = post_push(client, push_payload(sha, 'Add sixth panorama'))
+        job = wait_for_job(client, response.get_json()['job'], args.timeout)
+        finished.append(job)
+        chown = next((step for step in job['steps'] if step['step'] == 'chown'), {})
+        check(chown.get('exitCode') not in (0, None), f"chown exit code recorded ({chown.get('exitCode')})")
+        check(job['status'] == 'success', f"build still published ({job['status']})")
+        webhook.WEB_OWNER = f'{os.getuid()}:{os.getgid()}'
+
+        print("\nRelease mode and rollback:")
+        webhook.RELEASE_MODE = True
+        webhook.RELEASES_DIR = os.path.join(base, 'releases')
+        webhook.CURRENT_LINK = os.path.join(base, 'current')
+        releases = []
+        # The second deploy re-encodes first.jpg in place and prunes second.jpg's outputs
+        for name, seed, remove in (('seventh.jpg', 7, ()), ('first.jpg', 8, ('second.jpg',))):
+            sha = commit_image(work_dir, name, seed, f'Release {name}', remove=remove)
+            response = post_push(client, push_payload(sha, f'Release {name}'))
+            job = wait_for_job(client, response.get_json()['job'], args.timeout)
+            finished.append(job)
+            release = next((step for step in job['steps'] if step['step'] == 'release'), {})
+            check(job['status'] == 'success' and release.get('exitCode') == 0,
+                  f"release {release.get('release')} published ({job['status']}: {job['detail']})")
+            releases.append(os.path.join(webhook.RELEASES_DIR, release.get('release') or 'missing'))
+            if len(releases) == 1:
+                snapshot = build_outputs(releases[0])
+                check(snapshot and not any(link for link, _ in snapshot.values()),
+                      f'release holds its own build outputs ({len(snapshot)} files, no symlinks)')
+        check(os.path.realpath(webhook.CURRENT_LINK) == os.path.realpath(releases[-1]),
+              'current link points at the newest release')
+        check(build_outputs(releases[0]) == snapshot, "older release's outputs unchanged by the next build")
+        tmp_link = f'{webhook.CURRENT_LINK}.tmp'
+        os.symlink(releases[0], tmp_link)
+        os.replace(tmp_link, webhook.CURRENT_LINK)
+        rolled_back = os.path.realpath(webhook.CURRENT_LINK)
+        library_root = os.path.join(rolled_back, webhook.LIBRARY_ROOT)
+        missing = [path for path in library_paths(rolled_back) if not os.path.isfile(os.path.join(library_root, path))]
+        images = library_images(rolled_back)
+        check(images == 7 and not missing,
+              f'rolled back release serves all {images} images ({len(missing)} missing outputs)')
+        webhook.RELEASE_MODE = False
+
+        print("\nStructured log:")
+        events = []
+        with open(log_file) as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass
+        check(lines and len(events) == len(lines), f'every log line is JSON ({len(events)}/{len(lines)})')
+        deploys = [event for event in events if event.get('event') == 'deploy']
+        check([event['status'] for event in deploys] == [job['status'] for job in finished],
+              f"deploy events logged ({', '.join(event['status'] for event in deploys)})")
+        check(any(event.get('event') == 'step' and 'seconds' in event for event in events),
+              'step events carry durations')
+
+        print("\nMetrics:")
+        response = client.get('/metrics')
+        text = response.get_data(as_text=True)
+        check(response.status_code == 200, '/metrics answered 200')
+        builds = sum(1 for job in finished for step in job['steps'] if step['step'] == 'build')
+        for expected in (f'gallery_deploys_total{{result="success"}} {len(finished) - 1}',
+                         'gallery_deploys_total{result="failed"} 1',
+                         'gallery_deploys_total{result="superseded"} 1',
+                         'gallery_deploy_failures_total 1',
+                         'gallery_deploy_step_failures_total{step="pull"} 1',
+                         'gallery_deploy_step_failures_total{step="chown"} 1',
+                         f'gallery_deploy_step_duration_seconds_count{{step="build"}} {builds}',
+                         'gallery_deploy_step_duration_seconds_count{step="release"} 2'):
+            check(expected in text, expected)
+        check('gallery_deploy_last_success_timestamp_seconds 0\n' not in text, 'last success time set')
+        print()
+        print(text)
+    finally:
+        if args.keep:
+            print(f"Kept {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == '__main__':
+    main()
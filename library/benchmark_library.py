@@ -0,0 +1,339 @@
+"""
+Phong 360 Viewer - Library Builder Benchmark
+Measures build_library.py against synthetic equirectangular fixtures.
+
+- Generates gradient/noise panoramas offline (2K-16K, RGB and RGBA, PNG and JPEG)
+- Times each stage per fixture with the builder's own --profile instrumentation
+  (hash, decode, resize, encode, write, thumbnail)
+- Runs the full builder CLI for images/sec, peak RSS and output bytes per preset,
+  plus a second, cached run to time incremental no-op rebuilds
+- Writes machine-readable JSON; --compare prints the change against an earlier run
+
+Usage:
+    python benchmark_library.py --sizes 2K,4K --output bench-main.json
+    python benchmark_library.py --sizes 2K,4K --compare bench-main.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import statistics
+import subprocess
+import tempfile
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import PIL
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_library  # noqa: E402
+
+BUILDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_library.py')
+
+SIZES = {
+    '2K': (2048, 1024),
+    '4K': (4096, 2048),
+    '8K': (8192, 4096),
+    '16K': (16384, 8192)
+}
+
+PATTERNS = ('gradient', 'noise')
+
+BENCHMARK_VERSION = 1
+
+# Metrics --compare reports, with the direction that counts as an improvement
+COMPARE_METRICS = {
+    'imagesPerSec': 'higher',
+    'seconds': 'lower',
+    'cachedSeconds': 'lower',
+    'peakRssMb': 'lower',
+    'outputBytes': 'lower'
+}
+
+
+def make_fixture(pattern, size, mode):
+    """Synthetic equirectangular image: smooth gradients or incompressible noise.
+
+    Gradients compress well and resemble sky-heavy panoramas; noise is the
+    worst case for every encoder. Both are deterministic for a given size.
+    """
+    width, height = size
+    if pattern == 'noise':
+        # Fixed seed so fixtures (and output sizes) are stable across runs
+        data = random.Random(width).randbytes(width * height * len(mode))
+        return Image.frombytes(mode, size, data)
+
+    horizontal = Image.linear_gradient('L').rotate(90).resize(size)
+    vertical = Image.linear_gradient('L').resize(size)
+    bands = [horizontal, vertical, Image.eval(horizontal, lambda v: 255 - v)]
+    if mode == 'RGBA':
+        bands.append(Image.new('L', size, 255))
+    return Image.merge(mode, bands)
+
+
+def generate_fixtures(fixture_dir, sizes, modes, formats, patterns):
+    """Write every fixture combination under fixture_dir/bench, reusing existing files."""
+    fixtures = []
+    section_dir = os.path.join(fixture_dir, 'bench')
+    os.makedirs(section_dir, exist_ok=True)
+    for size_id in sizes:
+        for mode in modes:
+            for fmt in formats:
+                if fmt == 'jpeg' and mode == 'RGBA':
+                    continue  # JPEG has no alpha channel
+                for pattern in patterns:
+                    extension = 'jpg' if fmt == 'jpeg' else 'png'
+                    name = f"{pattern}-{size_id}-{mode.lower()}.{extension}"
+                    path = os.path.join(section_dir, name)
+                    if not os.path.exists(path):
+                        print(f"  Generating {name}...")
+                        img = make_fixture(pattern, SIZES[size_id], mode)
+                        if fmt == 'jpeg':
+                            img.save(path, 'JPEG', quality=95)
+                        else:
+                            img.save(path, 'PNG', compress_level=1)
+                        img.close()
+                    fixtures.append({
+                        'name': name,
+                        'path': path,
+                        'width': SIZES[size_id][0],
+                        'height': SIZES[size_id][1],
+                        'mode': mode,
+                        'format': fmt,
+                        'bytes': os.path.getsize(path)
+                    })
+    return fixtures
+
+
+def time_stages(path, presets, repeat):
+    """Median seconds per stage for one fixture, as recorded by the builder itself.
+
+    Runs build_library.process_image() with profile=True, so the stages are
+    exactly those of a real build: hash, decode, then resize, encode and
+    write summed over the preset cascade, and the thumbnail.
+    """
+    samples = {}
+    out_dir = tempfile.mkdtemp(prefix='p360-bench-')
+    try:
+        for _ in range(repeat):
+            outputs = build_library.process_image(
+                path, os.path.basename(path), None, presets,
+                build_library.DEFAULT_THUMBNAIL, out_dir, profile=True
+            )
+            totals = {}
+            for stage, _, seconds in outputs['profile']['stages']:
+                totals[stage] = totals.get(stage, 0) + seconds
+            for stage, seconds in totals.items():
+                samples.setdefault(stage, []).append(seconds)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {stage: round(statistics.median(values), 4) for stage, values in samples.items()}
+
+
+def directory_bytes(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def run_build(root_dir, output_file, build_args):
+    """Run the builder CLI in a subprocess; returns (seconds, peak RSS in MB).
+
+    The peak is the largest RSS of any builder process (including --jobs
+    workers) so far, or None when this run did not raise it.
+    """
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else 0
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, BUILDER, '--root', root_dir, '--output', output_file] + build_args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"build_library.py exited with status {result.returncode}")
+    peak_rss = None
+    if resource:
+        # ru_maxrss is the largest child so far (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if peak > before:
+            peak_rss = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return seconds, peak_rss
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current, baseline):
+    """Print the change of each headline metric against an earlier benchmark run."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('generated', '?')}):")
+    fixture_keys = ('sizes', 'modes', 'formats', 'patterns', 'jobs', 'buildArgs')
+    if any(current['config'].get(k) != baseline.get('config', {}).get(k) for k in fixture_keys):
+        print("  Warning: fixtures or build options differ between the runs; build totals are not comparable")
+    for metric, better in COMPARE_METRICS.items():
+        old, new = baseline['build'].get(metric), current['build'].get(metric)
+        if isinstance(old, dict):
+            old, new = sum(old.values()), sum((new or {}).values())
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        verdict = ''
+        if abs(change) >= 1:
+            improved = change > 0 if better == 'higher' else change < 0
+            verdict = '(better)' if improved else '(worse)'
+        print(f"  {metric:<14} {old:>14} -> {new:<14} {change:+.1f}% {verdict}")
+
+    for name, stages in current['stages'].items():
+        old_stages = baseline.get('stages', {}).get(name)
+        if not old_stages:
+            continue
+        deltas = ', '.join(
+            f"{stage} {(stages[stage] - old_stages[stage]) / old_stages[stage] * 100:+.0f}%"
+            for stage in stages if old_stages.get(stage)
+        )
+        print(f"  {name:<28} {deltas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the 360 image library builder on synthetic panoramas'
+    )
+    parser.add_argument('--sizes', default='2K,4K',
+                        help=f"Comma-separated fixture sizes from {', '.join(SIZES)} (default: 2K,4K)")
+    parser.add_argument('--modes', default='RGB,RGBA',
+                        help='Comma-separated color modes: RGB, RGBA (default: RGB,RGBA)')
+    parser.add_argument('--formats', default='jpeg,png',
+                        help='Comma-separated source formats: jpeg, png (default: jpeg,png)')
+    parser.add_argument('--patterns', default=','.join(PATTERNS),
+                        help='Comma-separated fixture patterns: gradient, noise (default: both)')
+    parser.add_argument('--fixtures', default=None,
+                        help='Directory to keep generated fixtures in between runs (default: temporary)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Stage timing repetitions per fixture; the median is reported (default: 3)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Worker processes passed to build_library.py (default: 1)')
+    parser.add_argument('--build-arg', action='append', default=[], metavar='ARG',
+                        help='Extra argument for build_library.py, e.g. --build-arg=--max-memory=512 (repeatable)')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Write results JSON to this file (default: print to stdout)')
+    parser.add_argument('--compare', default=None,
+                        help='Earlier results JSON to compare against')
+
+    args = parser.parse_args()
+
+    sizes = [s.strip().upper() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        print(f"Error: unknown size(s): {', '.join(unknown)}")
+        return 1
+    modes = [m.strip().upper() for m in args.modes.split(',') if m.strip()]
+    formats = [f.strip().lower() for f in args.formats.split(',') if f.strip()]
+    patterns = [p.strip().lower() for p in args.patterns.split(',') if p.strip()]
+
+    fixture_dir = args.fixtures or tempfile.mkdtemp(prefix='p360-fixtures-')
+    work_dir = tempfile.mkdtemp(prefix='p360-bench-build-')
+    try:
+        print(f"Fixtures: {fixture_dir}")
+        fixtures = generate_fixtures(fixture_dir, sizes, modes, formats, patterns)
+
+        print(f"\nTiming stages ({args.repeat} run(s) per fixture)...")
+        stages = {}
+        for fixture in fixtures:
+            stages[fixture['name']] = time_stages(fixture['path'], build_library.DEFAULT_PRESETS, args.repeat)
+            timings = ', '.join(f"{stage} {seconds:.3f}s" for stage, seconds in stages[fixture['name']].items())
+            print(f"  {fixture['name']:<28} {timings}")
+
+        # Full builds run on a copy so the fixture directory stays clean
+        root_dir = os.path.join(work_dir, 'library')
+        shutil.copytree(os.path.join(fixture_dir, 'bench'), os.path.join(root_dir, 'bench'))
+        output_file = os.path.join(work_dir, 'library.json')
+        build_args = ['--jobs', str(args.jobs)] + args.build_arg
+
+        print(f"\nFull build ({len(fixtures)} images, {args.jobs} worker(s))...")
+        seconds, peak_rss = run_build(root_dir, output_file, build_args + ['--force'])
+        print("Cached rebuild...")
+        cached_seconds, _ = run_build(root_dir, output_file, build_args)
+
+        build_dir = os.path.join(root_dir, '_BUILD')
+        output_bytes = {
+            entry.name: directory_bytes(entry.path)
+            for entry in sorted(os.scandir(build_dir), key=lambda entry: entry.name)
+            if entry.is_dir()
+        }
+
+        results = {
+            'version': BENCHMARK_VERSION,
+            'generated': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'platform': platform.platform(),
+                'cpuCount': os.cpu_count()
+            },
+            'config': {
+                'sizes': sizes,
+                'modes': modes,
+                'formats': formats,
+                'patterns': patterns,
+                'repeat': args.repeat,
+                'jobs': args.jobs,
+                'buildArgs': args.build_arg
+            },
+            'fixtures': [{k: v for k, v in fixture.items() if k != 'path'} for fixture in fixtures],
+            'stages': stages,
+            'build': {
+                'images': len(fixtures),
+                'seconds': round(seconds, 3),
+                'imagesPerSec': round(len(fixtures) / seconds, 3),
+                'cachedSeconds': round(cached_seconds, 3),
+                'peakRssMb': peak_rss,
+                'outputBytes': output_bytes
+            }
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.fixtures:
+            shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    build = results['build']
+    print(f"\n{build['images']} images in {build['seconds']}s ({build['imagesPerSec']} images/sec), "
+          f"cached rebuild {build['cachedSeconds']}s, peak RSS {build['peakRssMb']} MB")
+    for name, size in build['outputBytes'].items():
+        print(f"  - {name}: {size} bytes")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to: {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
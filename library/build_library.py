@@ -5,24 +5,74 @@ Generates v4.0 library.json with sections, context, and multi-resolution variant
 Features:
 - v4.0 format: sections array, context object, per-image slugs
 - Configurable resolution presets (8K, 4K, 2K)
+- Per-preset output formats: progressive JPEG, WebP, AVIF
+- Per-preset byte budgets (maxBytes / bitsPerPixel) instead of fixed quality
 - Adaptive loading support with bandwidth metadata
 - Smart resizing (never upscales)
+- Single decode per source, variants resized in cascade (8K -> 4K -> 2K -> thumbnail)
 - File size tracking for bandwidth estimation
 - Each directory becomes a section with configurable template
+- Parallel image processing across CPU cores (--jobs)
+- Distributed builds over a shared-filesystem work queue (--queue / --worker)
+- Incremental builds: a manifest in the build dir lets unchanged images be skipped
+- Low-memory mode (--max-memory) for very large sources
+- Optional cubemap or equirect tile pyramids for progressive streaming (build.tiles)
+- Inline BlurHash / LQIP placeholders per image (build.placeholder)
+- Per-section thumbnail sprite atlases (build.sprites)
+- Per-stage build profiling with Chrome trace / cProfile output (--profile)
+- Priority builds (--priority): thumbnails and the default preset are
+  published first, the other presets and tiles fill in afterwards
+- Watch mode (--watch): polls for new, changed or removed images and rebuilds incrementally
+- Precompressed .gz/.br library files (--precompress) and a normalized layout
+  that lists preset fields once (--normalize)
+- Content-hashed output filenames plus an asset manifest for immutable caching (--hashed-names)
+- Byte-identical images share one set of outputs; --near-duplicates reports
+  visually similar images via a perceptual hash
+- Sharded output (--shard): small root index plus content-hashed section shards
+- Crash-safe build journal: interrupted builds resume; --stream assembles
+  library.json from it without holding every entry in memory
 
 Version: 4.0.0
 """
 
 import os
+import io
+import sys
+import base64
+import gzip
 import json
 import hashlib
+import math
 import re
+import shelve
+import shutil
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from PIL import Image
+from PIL import Image, features
 from tqdm import tqdm
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import brotli
+except ImportError:  # optional: --precompress then writes .gz only
+    brotli = None
+
 DEFAULT_PRESETS = {
     '8K': {
         'width': 8192,
@@ -59,6 +109,105 @@ DEFAULT_THUMBNAIL = {
 
 SKIP_DIRS = ['_BUILD', 'output', 'tiles', 'tiles_diffused', 'temp', 'cache']
 
+# Build cache sidecar, stored inside the build dir
+BUILD_MANIFEST = '.build-manifest.json'
+BUILD_CACHE_VERSION = 2
+# Append-only log of finished images; lets a crashed build resume and
+# --stream assemble library.json without holding every entry in memory
+BUILD_JOURNAL = '.build-journal.jsonl'
+# Prefix of the on-disk dicts (see shelve) --stream keeps build records in
+BUILD_RECORDS = '.build-records'
+
+# Shared-directory work queue (--queue / --worker): queue settings, and
+# the job, claim and result folders inside the queue dir
+QUEUE_FILE = 'queue.json'
+QUEUE_DONE = 'done'
+DEFAULT_LEASE = 120
+
+# Dedup hashing runs on threads, up to this many images ahead of dispatch
+HASH_THREADS = 4
+HASH_LOOKAHEAD = 32
+
+# Low-memory mode (--max-memory): interpreter/Pillow overhead assumed outside
+# the image data, and the smallest row band ever decoded at once
+MEMORY_BASELINE = 64 * 1024 * 1024
+MIN_BAND_ROWS = 16
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG colour type -> (channels, Pillow raw mode), for 8-bit images
+PNG_COLOR_TYPES = {0: (1, 'L'), 2: (3, 'RGB'), 3: (1, 'P'), 4: (2, 'LA'), 6: (4, 'RGBA')}
+
+# Output format id -> (Pillow format, file extension, MIME type)
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'avif': ('AVIF', 'avif', 'image/avif')
+}
+
+# Lowest quality the byte-budget search (maxBytes / bitsPerPixel) may go to
+DEFAULT_MIN_QUALITY = 40
+
+DEFAULT_TILES = {
+    'type': 'cubemap',
+    'tileSize': 512,
+    'quality': 85
+}
+
+# Inline placeholders stored in each image entry: a BlurHash string (on by
+# default) and an optional tiny base64 JPEG ("LQIP")
+DEFAULT_PLACEHOLDER = {
+    'blurhash': True,
+    'componentsX': 4,
+    'componentsY': 3,
+    'lqip': False,
+    'lqipWidth': 32,
+    'lqipQuality': 50
+}
+
+# Per-section thumbnail sprite atlases (build.sprites)
+DEFAULT_SPRITES = {
+    'format': 'jpeg',
+    'quality': 80,
+    'maxWidth': 4096,
+    'maxHeight': 4096
+}
+
+# Stage timings and byte counts of the image being processed (--profile);
+# set per call by process_image(), so each worker process has its own
+_profile = None
+
+BLURHASH_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+# Cube face order used in tile names: front, right, back, left, up, down
+CUBE_FACES = ('f', 'r', 'b', 'l', 'u', 'd')
+
+# Preset keys that only describe a variant in library.json; changing them
+# must not force a re-encode
+DISPLAY_KEYS = ('label', 'recommended', 'bandwidth', 'default')
+
+
+@contextmanager
+def profile_stage(name):
+    """Time a processing stage of the current image when --profile is on."""
+    if _profile is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        _profile['stages'].append((name, start, time.time() - start))
+
+
+def profile_bytes(key, count):
+    if _profile is not None:
+        _profile[key] += count
+
+
+def profile_file_written(path):
+    if _profile is not None:
+        _profile['bytesWritten'] += os.path.getsize(path)
+
 
 def load_config(config_file):
     if os.path.exists(config_file):
@@ -71,6 +220,47 @@ def generate_short_hash(data, length=8):
     return hashlib.sha256(data.encode()).hexdigest()[:length]
 
 
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_file_atomic(path, data):
+    """Write bytes via a temp file and a rename, so an existing output is
+    replaced rather than changed in place (hard-linked copies keep theirs)."""
+    tmp_path = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def settings_signature(config):
+    """Hash the output-affecting part of a preset or thumbnail config."""
+    encode = {k: v for k, v in config.items() if k not in DISPLAY_KEYS}
+    return generate_short_hash(json.dumps([BUILD_CACHE_VERSION, encode], sort_keys=True), length=16)
+
+
+def output_signature(config, options):
+    """settings_signature() of an output file; hashed filenames change its path too."""
+    if options.get('hashed_names'):
+        config = {**config, 'hashedNames': True}
+    return settings_signature(config)
+
+
+def content_name(filename, data):
+    """Insert a short hash of `data` before the extension: `a.jpg` -> `a.1b2c3d4e.jpg`."""
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:8]}{extension}"
+
+
+def sort_presets(presets):
+    """Presets from largest to smallest, the order variants are generated in."""
+    return sorted(presets.items(), key=lambda x: x[1]['width'], reverse=True)
+
+
 def slugify(name):
     """Convert a filename/title to a URL-safe slug."""
     s = name.lower()
@@ -131,199 +321,2242 @@ def clean_title(raw_title, section_overrides):
     return title
 
 
-def get_image_metadata(image_path):
+def get_image_metadata(img, image_path):
+    """Collect metadata from an already opened source image."""
+    return {
+        'originalWidth': img.width,
+        'originalHeight': img.height,
+        'format': img.format,
+        'mode': img.mode,
+        'isPanorama': img.width / img.height >= 1.8,
+        'fileSize': os.path.getsize(image_path)
+    }
+
+
+def thumbnail_size(width, height, max_width, max_height):
+    """Size Image.thumbnail() would produce for a width x height source."""
+    if max_width >= width and max_height >= height:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    x, y = max_width, max_height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def format_supported(fmt):
+    """Whether this Pillow build can encode an IMAGE_FORMATS format id."""
+    if fmt not in IMAGE_FORMATS:
+        return False
+    if fmt == 'jpeg':
+        return True
     try:
-        with Image.open(image_path) as img:
-            return {
-                'originalWidth': img.width,
-                'originalHeight': img.height,
-                'format': img.format,
-                'mode': img.mode,
-                'isPanorama': img.width / img.height >= 1.8,
-                'fileSize': os.path.getsize(image_path)
-            }
-    except Exception as e:
-        print(f"\nError reading metadata for {image_path}: {str(e)}")
-        return None
+        return features.check(fmt)
+    except ValueError:
+        # Pillow without the feature flag (e.g. AVIF via pillow-avif-plugin)
+        Image.init()
+        return IMAGE_FORMATS[fmt][0] in Image.SAVE
+
+
+def encode_image(img, fmt, quality):
+    """Encode an image in one of IMAGE_FORMATS and return the bytes."""
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        img.save(buffer, "WEBP", quality=quality, method=6)
+    else:
+        img.save(buffer, IMAGE_FORMATS[fmt][0], quality=quality)
+    return buffer.getvalue()
+
+
+def encode_to_budget(img, fmt, max_quality, max_bytes, min_quality=DEFAULT_MIN_QUALITY):
+    """Binary-search the highest quality whose encoding fits in max_bytes.
+
+    Returns (data, quality). If even min_quality does not fit, the
+    min_quality encoding is returned anyway; callers spot that by
+    comparing len(data) with max_bytes.
+    """
+    data = encode_image(img, fmt, max_quality)
+    if len(data) <= max_bytes:
+        return data, max_quality
+
+    best = None
+    low, high = min_quality, max_quality - 1
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = encode_image(img, fmt, quality)
+        if len(candidate) <= max_bytes:
+            best = (candidate, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
 
+    return best or (encode_image(img, fmt, min_quality), min_quality)
+
+
+def preset_byte_budget(preset_config):
+    """Byte budget from a preset's `maxBytes` or `bitsPerPixel`, or None."""
+    if preset_config.get('maxBytes'):
+        return int(preset_config['maxBytes'])
+    if preset_config.get('bitsPerPixel'):
+        return int(preset_config['bitsPerPixel'] * preset_config['width'] * preset_config['height'] / 8)
+    return None
 
-def generate_resolution_variants(image_path, presets, output_dir, rel_path, build_dir='_BUILD'):
+
+def generate_resolution_variants(img, presets, output_dir, rel_path, build_dir='_BUILD', hashed_names=False):
+    """Write each preset in its output formats, resizing in cascade from largest to smallest.
+
+    Each variant is resampled from the previous (larger) one instead of the
+    full-resolution source. A preset's `formats` list (default `['jpeg']`)
+    picks the encodings; the first one is the variant's primary `path`.
+    With a byte budget (`maxBytes` or `bitsPerPixel`) each encoding uses
+    the highest quality up to `quality` that fits; one that does not fit
+    even at `minQuality` is kept, with a warning and `overBudget: true`. With `hashed_names` each
+    filename carries a hash of its bytes (see content_name()). Returns the
+    variant list and the smallest resized image, which callers can reuse to
+    derive the thumbnail.
+    """
     variants = []
-    try:
-        with Image.open(image_path) as img:
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-
-            original_width = img.size[0]
-            base_filename = rel_path.replace('/', '-').replace(' ', '-')
-            base_filename = os.path.splitext(base_filename)[0]
-
-            sorted_presets = sorted(
-                presets.items(),
-                key=lambda x: x[1]['width'],
-                reverse=True
-            )
+    original_width = img.size[0]
+    base_filename = rel_path.replace('/', '-').replace(' ', '-')
+    base_filename = os.path.splitext(base_filename)[0]
 
-            for preset_id, preset_config in sorted_presets:
-                target_width = preset_config['width']
-                target_height = preset_config['height']
+    source = img
+    for preset_id, preset_config in sort_presets(presets):
+        target_width = preset_config['width']
+        target_height = preset_config['height']
 
-                if target_width > original_width:
-                    continue
+        if target_width > original_width:
+            continue
 
-                resized = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                output_path = os.path.join(output_dir, preset_id, f"{base_filename}.jpg")
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                resized.save(output_path, "JPEG", quality=preset_config['quality'])
-
-                file_size = os.path.getsize(output_path)
-
-                variant = {
-                    'id': preset_id.lower(),
-                    'label': preset_config['label'],
-                    'width': target_width,
-                    'height': target_height,
-                    'path': f"{build_dir}/{preset_id}/{base_filename}.jpg",
-                    'fileSize': file_size,
-                    'quality': preset_config['quality'],
-                    'recommended': preset_config['recommended'],
-                    'bandwidth': preset_config['bandwidth']
-                }
+        # Presets can disagree on aspect ratio; never resample up from a smaller level
+        if source.width < target_width or source.height < target_height:
+            source = img
 
-                if preset_config.get('default', False):
-                    variant['default'] = True
+        try:
+            if source.size == (target_width, target_height):
+                resized = source
+            else:
+                with profile_stage('resize'):
+                    resized = source.resize((target_width, target_height), Image.Resampling.LANCZOS)
+            os.makedirs(os.path.join(output_dir, preset_id), exist_ok=True)
+
+            budget = preset_byte_budget(preset_config)
+            encodings = []
+            for fmt in preset_config.get('formats', ['jpeg']):
+                _, extension, mime = IMAGE_FORMATS[fmt]
+                quality = preset_config['quality']
+                with profile_stage('encode'):
+                    if budget:
+                        data, quality = encode_to_budget(
+                            resized, fmt, quality, budget,
+                            min_quality=preset_config.get('minQuality', DEFAULT_MIN_QUALITY)
+                        )
+                    else:
+                        data = encode_image(resized, fmt, quality)
+                filename = f"{base_filename}.{extension}"
+                if hashed_names:
+                    filename = content_name(filename, data)
+                with profile_stage('write'):
+                    write_file_atomic(os.path.join(output_dir, preset_id, filename), data)
+                profile_bytes('bytesWritten', len(data))
+                encoding = {
+                    'format': fmt,
+                    'mime': mime,
+                    'path': f"{build_dir}/{preset_id}/{filename}",
+                    'fileSize': len(data),
+                    'quality': quality
+                }
+                if budget and len(data) > budget:
+                    print(f"\nWarning: {preset_id} {fmt} of {rel_path} is {len(data)} bytes at quality {quality}, "
+                          f"over its {budget} byte budget")
+                    encoding['overBudget'] = True
+                encodings.append(encoding)
+        except Exception as e:
+            print(f"\nError generating {preset_id} variant for {rel_path}: {str(e)}")
+            continue
+
+        source = resized
+
+        variant = {
+            'id': preset_id.lower(),
+            'label': preset_config['label'],
+            'width': target_width,
+            'height': target_height,
+            'path': encodings[0]['path'],
+            'fileSize': encodings[0]['fileSize'],
+            'quality': encodings[0]['quality'],
+            'recommended': preset_config['recommended'],
+            'bandwidth': preset_config['bandwidth']
+        }
 
-                variants.append(variant)
+        if budget:
+            variant['maxBytes'] = budget
+            if encodings[0].get('overBudget'):
+                variant['overBudget'] = True
+        if len(encodings) > 1:
+            variant['encodings'] = encodings
 
-    except Exception as e:
-        print(f"\nError generating variants for {image_path}: {str(e)}")
+        if preset_config.get('default', False):
+            variant['default'] = True
 
-    return variants
+        variants.append(variant)
 
+    return variants, source
 
-def generate_thumbnail(image_path, thumbnail_config, output_dir, rel_path, build_dir='_BUILD'):
-    try:
-        with Image.open(image_path) as img:
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
 
-            img.thumbnail((thumbnail_config['width'], thumbnail_config['height']))
+def refresh_variant(variant, preset_config):
+    """Re-apply display-only preset fields to a cached variant entry."""
+    variant = dict(variant)
+    variant['label'] = preset_config['label']
+    variant['recommended'] = preset_config['recommended']
+    variant['bandwidth'] = preset_config['bandwidth']
+    variant.pop('default', None)
+    if preset_config.get('default', False):
+        variant['default'] = True
+    return variant
 
-            thumbnail_name = rel_path.replace('/', '-').replace(' ', '-')
-            thumbnail_name = os.path.splitext(thumbnail_name)[0] + '.jpg'
-            thumbnail_path = os.path.join(output_dir, 'thumbnails', thumbnail_name)
 
-            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-            img.save(thumbnail_path, "JPEG", quality=thumbnail_config['quality'])
+def generate_thumbnail(img, thumbnail_config, output_dir, rel_path, build_dir='_BUILD', size=None, hashed_names=False):
+    """Write the thumbnail JPEG.
 
-            return {
-                'path': f"{build_dir}/thumbnails/{thumbnail_name}",
-                'width': img.width,
-                'height': img.height
-            }
+    `size` defaults to what Image.thumbnail() would give for `img`; pass it
+    explicitly when `img` is a resized level rather than the original.
+    """
+    try:
+        if size is None:
+            size = thumbnail_size(img.width, img.height, thumbnail_config['width'], thumbnail_config['height'])
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+        thumbnail_name = rel_path.replace('/', '-').replace(' ', '-')
+        thumbnail_name = os.path.splitext(thumbnail_name)[0] + '.jpg'
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=thumbnail_config['quality'])
+        data = buffer.getvalue()
+        if hashed_names:
+            thumbnail_name = content_name(thumbnail_name, data)
+        thumbnail_path = os.path.join(output_dir, 'thumbnails', thumbnail_name)
+
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        write_file_atomic(thumbnail_path, data)
+        profile_bytes('bytesWritten', len(data))
+
+        return {
+            'path': f"{build_dir}/thumbnails/{thumbnail_name}",
+            'width': img.width,
+            'height': img.height
+        }
     except Exception as e:
-        print(f"\nError generating thumbnail for {image_path}: {str(e)}")
+        print(f"\nError generating thumbnail for {rel_path}: {str(e)}")
         return None
 
 
-def scan_directory(root_dir, presets, thumbnail_config, default_template, include_metadata=True, site_config=None, build_dir='_BUILD'):
-    """Scan directory for images and build v4.0 library structure."""
-    sections = []
-    total_images = 0
+def layout_sprites(sizes, max_width, max_height):
+    """Shelf-pack (width, height) rectangles, in order, into atlases.
+
+    Returns the (atlas index, x, y) of every rectangle and the (width,
+    height) of every atlas. A rectangle larger than the limits gets an
+    atlas of its own.
+    """
+    placements = []
+    atlases = []
+    x = y = shelf = 0
+    for width, height in sizes:
+        if atlases and x > 0 and x + width > max_width:
+            x, y, shelf = 0, y + shelf, 0
+        if not atlases or (y > 0 and y + height > max_height):
+            atlases.append([0, 0])
+            x = y = shelf = 0
+        placements.append((len(atlases) - 1, x, y))
+        atlases[-1][0] = max(atlases[-1][0], x + width)
+        atlases[-1][1] = max(atlases[-1][1], y + height)
+        x += width
+        shelf = max(shelf, height)
+    return placements, [tuple(size) for size in atlases]
+
+
+def write_sprite_atlases(root_dir, thumbnails, sprite_config, output_dir, name, build_dir='_BUILD', hashed_names=False):
+    """Pack thumbnails (thumbnail entries, in order) into sprite atlases.
+
+    Atlases are written as `sprites/<name>-<n>` in output_dir, one at a
+    time so only one is held in memory. Thumbnails with the same path share
+    a rectangle. Returns a `sprite` object per thumbnail, the atlas paths
+    and the subset of them whose content changed.
+    """
+    unique = {}
+    for thumbnail in thumbnails:
+        unique.setdefault(thumbnail['path'], thumbnail)
+    placements, sizes = layout_sprites(
+        [(thumbnail['width'], thumbnail['height']) for thumbnail in unique.values()],
+        sprite_config['maxWidth'], sprite_config['maxHeight']
+    )
+    fmt = sprite_config['format']
+    extension = IMAGE_FORMATS[fmt][1]
+
+    rects = {}
+    paths = []
+    written = []
+    for atlas, size in enumerate(sizes):
+        canvas = Image.new('RGB', size)
+        for (path, thumbnail), (index, x, y) in zip(unique.items(), placements):
+            if index != atlas:
+                continue
+            with Image.open(os.path.join(root_dir, path)) as img:
+                canvas.paste(img.convert('RGB'), (x, y))
+            rects[path] = (atlas, x, y)
+        data = encode_image(canvas, fmt, sprite_config['quality'])
+        filename = f"{name}-{atlas}.{extension}"
+        if hashed_names:
+            filename = content_name(filename, data)
+        atlas_path = os.path.join(output_dir, 'sprites', filename)
+        try:
+            with open(atlas_path, 'rb') as f:
+                unchanged = f.read() == data
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            os.makedirs(os.path.dirname(atlas_path), exist_ok=True)
+            write_file_atomic(atlas_path, data)
+            written.append(f"{build_dir}/sprites/{filename}")
+        paths.append(f"{build_dir}/sprites/{filename}")
+
+    sprites = []
+    for thumbnail in thumbnails:
+        atlas, x, y = rects[thumbnail['path']]
+        sprites.append({
+            'path': paths[atlas],
+            'x': x,
+            'y': y,
+            'atlasWidth': sizes[atlas][0],
+            'atlasHeight': sizes[atlas][1]
+        })
+    return sprites, paths, written
+
+
+def encode_base83(value, length):
+    return ''.join(
+        BLURHASH_DIGITS[(value // 83 ** (length - i - 1)) % 83] for i in range(length)
+    )
 
-    skip_dirs = list(SKIP_DIRS)
-    if build_dir not in skip_dirs:
-        skip_dirs.append(build_dir)
 
-    total_files = sum(
-        len(files) for r, d, files in os.walk(root_dir)
-        if not any(skip in r for skip in skip_dirs)
+def srgb_to_linear(value):
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(img, components_x=4, components_y=3):
+    """Encode a (small) RGB image as a BlurHash string.
+
+    Follows the reference encoder (https://blurha.sh); `img` should already
+    be downscaled to a few dozen pixels, so the DCT stays cheap.
+    """
+    width, height = img.size
+    linear = [srgb_to_linear(v) for v in range(256)]
+    data = img.tobytes()
+    pixels = [(linear[data[k]], linear[data[k + 1]], linear[data[k + 2]]) for k in range(0, len(data), 3)]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(math.floor(max(abs(v) for f in ac for v in f) * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    blurhash += encode_base83(quantised_max, 1)
+    blurhash += encode_base83(
+        (linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4
     )
 
-    with tqdm(total=total_files, desc="Processing images") as pbar:
-        for dirpath, dirnames, filenames in os.walk(root_dir):
-            if any(skip in dirpath for skip in skip_dirs):
+    def quantise(v):
+        v /= max_value
+        return max(0, min(18, int(math.floor(math.copysign(abs(v) ** 0.5, v) * 9 + 9.5))))
+
+    for r, g, b in ac:
+        blurhash += encode_base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return blurhash
+
+
+def generate_placeholder(img, placeholder_config):
+    """BlurHash and/or inline LQIP data URI for an image entry.
+
+    `img` can be any decoded level of the source (the smallest variant is
+    cheapest); it is shrunk to `lqipWidth` pixels wide first.
+    """
+    width = placeholder_config['lqipWidth']
+    size = (width, max(1, round(width * img.height / img.width)))
+    small = img.resize(size, Image.Resampling.BICUBIC, reducing_gap=2.0).convert('RGB')
+
+    placeholder = {}
+    if placeholder_config.get('blurhash'):
+        placeholder['blurhash'] = blurhash_encode(
+            small, placeholder_config['componentsX'], placeholder_config['componentsY']
+        )
+    if placeholder_config.get('lqip'):
+        buffer = io.BytesIO()
+        small.save(buffer, 'JPEG', quality=placeholder_config['lqipQuality'], optimize=True)
+        placeholder['lqip'] = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    placeholder['width'], placeholder['height'] = small.size
+    return placeholder
+
+
+def perceptual_hash(img):
+    """64-bit difference hash (dHash) of an image, as 16 hex digits.
+
+    Near-identical images (re-exports, slight edits, different sizes) end
+    up a small Hamming distance apart.
+    """
+    small = img.resize((9, 8), Image.Resampling.BILINEAR, reducing_gap=2.0).convert('L').tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (small[row * 9 + col] > small[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def cube_face_direction(face, u, v):
+    """Direction for face coordinates u, v in [-1, 1] (u right, v down), y up."""
+    if face == 'f':
+        return u, -v, 1.0
+    if face == 'r':
+        return 1.0, -v, -u
+    if face == 'b':
+        return -u, -v, -1.0
+    if face == 'l':
+        return -1.0, -v, u
+    if face == 'u':
+        return u, 1.0, v
+    return u, -1.0, -v
+
+
+def cube_face_mesh(face, face_size, width, height, pad, cell=16):
+    """Image.transform() MESH data projecting an equirect image onto a cube face.
+
+    The face is split into cells of about `cell` pixels; each cell maps to
+    the quad its corners land on in the equirect source. The source is
+    expected to be padded by `pad` wrapped columns on both sides so quads
+    crossing the +/-180 degree seam stay contiguous.
+    """
+    mesh = []
+    cells = max(1, face_size // cell)
+    step = face_size / cells
+    for j in range(cells):
+        for i in range(cells):
+            x0, y0 = round(i * step), round(j * step)
+            x1, y1 = round((i + 1) * step), round((j + 1) * step)
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            quad = []
+            ref = None
+            # Corner order expected by MESH: upper-left, lower-left, lower-right, upper-right
+            for px, py in ((x0, y0), (x0, y1), (x1, y1), (x1, y0)):
+                # Nudge towards the cell centre so a corner on a pole still has a longitude
+                px += (cx - px) * 1e-3
+                py += (cy - py) * 1e-3
+                x, y, z = cube_face_direction(face, 2 * px / face_size - 1, 2 * py / face_size - 1)
+                lon = math.atan2(x, z)
+                lat = math.atan2(y, math.hypot(x, z))
+                if ref is None:
+                    ref = lon
+                elif lon - ref > math.pi:
+                    lon -= 2 * math.pi
+                elif lon - ref < -math.pi:
+                    lon += 2 * math.pi
+                quad += [(lon / (2 * math.pi) + 0.5) * width + pad, (0.5 - lat / math.pi) * height]
+            mesh.append(((x0, y0, x1, y1), tuple(quad)))
+    return mesh
+
+
+def save_tiles(img, directory, prefix, tile_size, quality, digest=None):
+    """Write an image as a grid of JPEG tiles, feeding their bytes to `digest` if given."""
+    for row in range(math.ceil(img.height / tile_size)):
+        for col in range(math.ceil(img.width / tile_size)):
+            box = (col * tile_size, row * tile_size,
+                   min((col + 1) * tile_size, img.width), min((row + 1) * tile_size, img.height))
+            tile_name = f"{prefix}{row}_{col}.jpg"
+            tile_path = os.path.join(directory, tile_name)
+            if digest is None:
+                img.crop(box).save(tile_path, "JPEG", quality=quality)
+                profile_file_written(tile_path)
                 continue
+            buffer = io.BytesIO()
+            img.crop(box).save(buffer, "JPEG", quality=quality)
+            # The level directory name is part of the tile's identity
+            digest.update(f"{os.path.basename(directory)}/{tile_name}".encode())
+            digest.update(buffer.getvalue())
+            with open(tile_path, 'wb') as f:
+                f.write(buffer.getvalue())
+            profile_bytes('bytesWritten', buffer.tell())
+
+
+def generate_tiles(img, tiles_config, output_dir, rel_path, build_dir='_BUILD', hashed_names=False):
+    """Cut an equirect image into a multi-resolution tile pyramid.
+
+    Level 0 is a single tile per cube face (or a 2x1 equirect grid); each
+    level doubles the edge length, up to the largest level the source can
+    fill. Levels are produced from the top down, each resized from the one
+    above it. With `hashed_names` the pyramid directory is named after a
+    hash of every tile, so a changed pyramid gets a new URL prefix.
+    """
+    try:
+        tile_size = tiles_config['tileSize']
+        cubemap = tiles_config['type'] == 'cubemap'
+        # Equirect width needed per tile edge at a level: 4 cube faces or 2 tiles
+        span = 4 if cubemap else 2
+
+        base_filename = rel_path.replace('/', '-').replace(' ', '-')
+        base_filename = os.path.splitext(base_filename)[0]
+        digest = None
+        tiles_name = base_filename
+        if hashed_names:
+            # Written under a scratch name, renamed once the hash is known
+            digest = hashlib.sha256()
+            tiles_name = f"{base_filename}.tmp-{os.getpid()}"
+        tiles_dir = os.path.join(output_dir, 'tiles', tiles_name)
+        # Drop tiles from a previous layout so no stale files survive
+        if os.path.isdir(tiles_dir):
+            shutil.rmtree(tiles_dir)
+
+        top = 0
+        while span * tile_size * 2 ** (top + 1) <= img.width:
+            top += 1
+
+        levels = []
+        equirect = img
+        for level in range(top, -1, -1):
+            edge = tile_size * 2 ** level
+            size = (span * edge, span * edge // 2)
+            if equirect.size != size:
+                equirect = equirect.resize(size, Image.Resampling.LANCZOS)
+
+            level_dir = os.path.join(tiles_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+
+            if cubemap:
+                padded = Image.new('RGB', (size[0] + 2 * edge, size[1]))
+                padded.paste(equirect, (edge, 0))
+                padded.paste(equirect.crop((size[0] - edge, 0, size[0], size[1])), (0, 0))
+                padded.paste(equirect.crop((0, 0, edge, size[1])), (size[0] + edge, 0))
+                for face in CUBE_FACES:
+                    face_img = padded.transform(
+                        (edge, edge), Image.Transform.MESH,
+                        cube_face_mesh(face, edge, size[0], size[1], edge),
+                        Image.Resampling.BILINEAR
+                    )
+                    save_tiles(face_img, level_dir, f"{face}_", tile_size, tiles_config['quality'], digest)
+                levels.append({'level': level, 'size': edge, 'tiles': 2 ** level})
+            else:
+                save_tiles(equirect, level_dir, '', tile_size, tiles_config['quality'], digest)
+                levels.append({
+                    'level': level,
+                    'width': size[0],
+                    'height': size[1],
+                    'columns': 2 ** (level + 1),
+                    'rows': 2 ** level
+                })
+
+        if digest is not None:
+            tiles_name = f"{base_filename}.{digest.hexdigest()[:8]}"
+            final_dir = os.path.join(output_dir, 'tiles', tiles_name)
+            if os.path.isdir(final_dir):
+                # Same tiles as an earlier build; keep the published copy
+                shutil.rmtree(tiles_dir)
+            else:
+                os.replace(tiles_dir, final_dir)
+
+        levels.reverse()
+        pattern = '{face}_{row}_{col}.jpg' if cubemap else '{row}_{col}.jpg'
+        tiles = {
+            'type': tiles_config['type'],
+            'tileSize': tile_size,
+            'path': f"{build_dir}/tiles/{tiles_name}/{{level}}/{pattern}",
+        }
+        if cubemap:
+            tiles['faces'] = list(CUBE_FACES)
+        tiles['levels'] = levels
+        return tiles
+    except Exception as e:
+        print(f"\nError generating tiles for {rel_path}: {str(e)}")
+        return None
 
-            rel_path = os.path.relpath(dirpath, root_dir)
-            if rel_path == '.':
-                rel_path = ''
 
-            image_files = sorted(
-                f for f in filenames
-                if f.lower().endswith(('.png', '.jpg', '.jpeg'))
-            )
+def tiles_directory(tiles):
+    """Directory (relative to the library root) holding a tile pyramid."""
+    return tiles['path'].split('/{level}/')[0]
 
-            if image_files:
-                path_parts = rel_path.split(os.sep) if rel_path else []
-                section_name = path_parts[0] if path_parts else 'Root'
-                section_id = slugify(section_name)
-
-                # Check if section already exists
-                existing = next((s for s in sections if s['id'] == section_id), None)
-                if not existing:
-                    section_overrides = {}
-                    if site_config and 'sections' in site_config:
-                        section_overrides = site_config['sections'].get(section_name, {})
-                    existing = {
-                        'id': section_id,
-                        'title': section_overrides.get('title', section_name),
-                        'template': section_overrides.get('template', default_template),
-                        'icon': section_overrides.get('icon', 'folder'),
-                        'images': []
-                    }
-                    sections.append(existing)
 
-                for image_file in image_files:
-                    name_without_ext = os.path.splitext(image_file)[0]
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def band_rows_for_budget(budget, src_width, size):
+    """How many source rows may be decoded at once within `budget` bytes."""
+    # The resized level and the next cascade level are held whole for encoding
+    fixed = MEMORY_BASELINE + size[0] * size[1] * 3 * 2
+    # Inflated rows plus their stored-PNG copies, the decoded band, its RGB
+    # copy and the rolling buffer (which can span two bands)
+    per_row = src_width * 4 * 8
+    return max(MIN_BAND_ROWS, (budget - fixed) // per_row)
+
+
+def decode_memory(src, size, band_rows, streamable):
+    """Estimated peak bytes of a banded decode and of a whole decode of `src`.
+
+    Pillow keeps multi-band images at 4 bytes per pixel. A whole decode
+    peaks either while a non-RGB source is converted (both copies held) or
+    while the first level is resized and encoded from the RGB source; a
+    banded decode holds the bands and two levels of `size`, plus the whole
+    source when it cannot be streamed.
+    """
+    pixels = src.width * src.height
+    source = pixels * (1 if src.mode in ('1', 'L', 'P') else 4)
+    converting = source + pixels * 4 if src.mode != 'RGB' else 0
+    encoding = pixels * 4 + size[0] * size[1] * 2
+    if size != src.size:
+        encoding += size[0] * size[1] * 4
+    unbanded = MEMORY_BASELINE + max(converting, encoding)
+    banded = MEMORY_BASELINE + size[0] * size[1] * 3 * 2 + band_rows * src.width * 4 * 8
+    if not streamable:
+        banded += source
+    return banded, unbanded
+
+
+def read_png_chunks(f):
+    """Yield (type, data) for each chunk of a PNG file positioned after the signature."""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = f.read(length)
+        f.read(4)  # CRC
+        yield chunk_type, data
+        if chunk_type == b'IEND':
+            return
 
-                    # Clean title using section overrides
-                    section_overrides = {}
-                    if site_config and 'sections' in site_config:
-                        section_overrides = site_config['sections'].get(section_name, {})
-                    title = clean_title(name_without_ext, section_overrides)
 
-                    file_path = os.path.join(rel_path, image_file).replace(os.sep, '/') if rel_path else image_file
-                    full_path = os.path.join(root_dir, file_path)
+def png_chunk(chunk_type, data):
+    crc = zlib.crc32(chunk_type + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+
+def png_can_stream(image_path):
+    """Whether iter_png_bands() can decode this PNG (8-bit, non-interlaced)."""
+    with open(image_path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return False
+        chunk_type, data = next(read_png_chunks(f), (None, b''))
+    if chunk_type != b'IHDR' or len(data) != 13:
+        return False
+    _, _, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+    return bit_depth == 8 and not interlace and color_type in PNG_COLOR_TYPES
+
+
+def iter_png_bands(image_path, band_rows):
+    """Yield (top, band) images of a PNG, decoding band_rows rows at a time.
+
+    IDAT data is inflated incrementally and each band is re-wrapped as a
+    small stored (uncompressed) PNG for Pillow to unfilter. The previous
+    band's last row is prepended with filter type None so Up/Average/Paeth
+    filters on the band's first row still see their reference row. Only
+    valid for files png_can_stream() accepts.
+    """
+    with open(image_path, 'rb') as f:
+        f.read(8)
+        chunks = read_png_chunks(f)
+        _, ihdr = next(chunks)
+        width, height, _, color_type = struct.unpack('>IIBB', ihdr[:10])
+        channels, rawmode = PNG_COLOR_TYPES[color_type]
+        row_bytes = 1 + width * channels
+        # PLTE/tRNS precede the first IDAT and are needed to decode every band
+        extra = []
+
+        def idat_data():
+            for chunk_type, data in chunks:
+                if chunk_type == b'IDAT':
+                    yield data
+                elif chunk_type in (b'PLTE', b'tRNS'):
+                    extra.append(png_chunk(chunk_type, data))
+
+        idat = idat_data()
+        inflater = zlib.decompressobj()
+        previous = None
+
+        for top in range(0, height, band_rows):
+            rows = min(band_rows, height - top)
+            raw = bytearray(b'\x00' + previous) if previous is not None else bytearray()
+            need = len(raw) + rows * row_bytes
+            while len(raw) < need:
+                data = inflater.unconsumed_tail or next(idat, None)
+                if data is None:
+                    raise ValueError(f"Truncated PNG data in {image_path}")
+                raw += inflater.decompress(data, need - len(raw))
+
+            band_height = rows + (previous is not None)
+            header = struct.pack('>IIBBBBB', width, band_height, 8, color_type, 0, 0, 0)
+            band = Image.open(io.BytesIO(
+                PNG_SIGNATURE + png_chunk(b'IHDR', header) + b''.join(extra)
+                + png_chunk(b'IDAT', zlib.compress(raw, 0)) + png_chunk(b'IEND', b'')
+            ))
+            band.load()
+            del raw
+
+            previous = band.crop((0, band_height - 1, width, band_height)).tobytes('raw', rawmode)
+            if band_height > rows:
+                band = band.crop((0, 1, width, band_height))
+            yield top, band
+
+
+def iter_image_bands(img, band_rows):
+    """Yield (top, band) crops of an in-memory image."""
+    for top in range(0, img.height, band_rows):
+        yield top, img.crop((0, top, img.width, min(top + band_rows, img.height)))
+
+
+def resize_in_strips(bands, src_size, size, band_rows):
+    """LANCZOS-resize a top-to-bottom stream of row bands to an RGB image.
+
+    Only the source rows the current output strip's filter window needs are
+    kept, and bands are converted to RGB one at a time. The result matches
+    a single Image.resize() of the whole source to within one level of
+    floating-point rounding.
+    """
+    src_width, src_height = src_size
+    width, height = size
+    scale = src_height / height
+    # LANCZOS reads 3 source pixels per output pixel either side when downscaling
+    margin = math.ceil(3 * max(scale, 1.0)) + 2
+    step = max(1, int(band_rows / scale))
+
+    result = Image.new('RGB', size)
+    bands = iter(bands)
+    buffer, buffer_top = None, 0
+
+    for y0 in range(0, height, step):
+        y1 = min(y0 + step, height)
+        top = max(int(y0 * scale) - margin, 0)
+        bottom = min(math.ceil(y1 * scale) + margin, src_height)
+
+        if buffer is not None and top >= buffer_top + buffer.height:
+            buffer = None
+        elif buffer is not None and top > buffer_top:
+            buffer = buffer.crop((0, top - buffer_top, src_width, buffer.height))
+            buffer_top = top
+
+        while buffer is None or buffer_top + buffer.height < bottom:
+            band_top, band = next(bands)
+            if band.mode != 'RGB':
+                band = band.convert('RGB')
+            if buffer is None or band_top + band.height <= top:
+                buffer, buffer_top = band, band_top
+            else:
+                merged = Image.new('RGB', (src_width, buffer.height + band.height))
+                merged.paste(buffer, (0, 0))
+                merged.paste(band, (0, buffer.height))
+                buffer = merged
+
+        strip = buffer.resize(
+            (width, y1 - y0), Image.Resampling.LANCZOS,
+            box=(0, y0 * scale - buffer_top, src_width, y1 * scale - buffer_top)
+        )
+        result.paste(strip, (0, y0))
+
+    return result
+
+
+def load_bounded(src, image_path, size, budget):
+    """Decode an opened source down to an RGB image of `size` within `budget` bytes.
+
+    JPEG sources are decoded at a reduced DCT scale via draft(), and 8-bit
+    non-interlaced PNGs are streamed in row bands sized to `budget` bytes.
+    Anything else has to be decoded whole, but is still converted and
+    resampled strip-wise so no full-resolution copy is made. When banding
+    would not use less memory than a whole decode (see decode_memory()),
+    the source is decoded whole and returned at its own size for the
+    caller to resize, and a warning is printed when neither fits `budget`.
+    """
+    streamable = src.format == 'PNG' and png_can_stream(image_path)
+    if src.format == 'JPEG':
+        src.draft(None, size)
+    band_rows = band_rows_for_budget(budget, src.width, size)
+    banded, unbanded = decode_memory(src, size, band_rows, streamable)
+    needed = min(banded, unbanded)
+    if needed > budget:
+        print(f"\nWarning: {image_path} needs about {needed // (1024 * 1024)} MB to decode, "
+              f"over the {budget // (1024 * 1024)} MB memory budget")
+
+    if unbanded <= banded:
+        src.load()
+        return src if src.mode == 'RGB' else src.convert('RGB')
+    if streamable:
+        bands = iter_png_bands(image_path, band_rows)
+    else:
+        src.load()
+        bands = iter_image_bands(src, band_rows)
+    return resize_in_strips(bands, src.size, size, band_rows)
+
+
+def process_image(full_path, file_path, cache, presets, thumbnail_config, output_dir, build_dir='_BUILD', max_memory=None, tiles_config=None, placeholder_config=None, profile=False, perceptual_hash_enabled=False, hashed_names=False):
+    """Generate the thumbnail, resolution variants and metadata for one image.
+
+    `cache` holds outputs from a previous build that are still valid for the
+    current settings (see reusable_outputs()); they are kept as long as the
+    source content hash still matches, and only the rest is regenerated.
+
+    The source is decoded at most once; variants are resized in cascade and
+    the thumbnail is taken from the smallest variant that is still large
+    enough. With `max_memory` (MB) the source is first decoded straight to
+    the largest size needed via load_bounded(). With `tiles_config` a tile
+    pyramid is cut from the decoded image as well, and with
+    `placeholder_config` a BlurHash/LQIP is computed from the smallest
+    level, as is the perceptual hash with `perceptual_hash_enabled`.
+    `hashed_names` puts a content hash in every output filename. Must stay
+    a top-level function so it can be pickled into worker processes.
+
+    Returns a dict with the source `sha256`, `metadata`, `thumbnail`,
+    `resolutions` keyed by preset id (None for presets larger than the
+    source), `tiles`, `placeholder` and `phash`, plus `peakRss` in MB when
+    `max_memory` is set and, with `profile`, a `profile` dict of stage
+    timings (name, start, seconds) and bytes read/written.
+    """
+    global _profile
+    _profile = {'pid': os.getpid(), 'stages': [], 'bytesRead': 0, 'bytesWritten': 0} if profile else None
+
+    cache = cache or {}
+    if cache.get('trusted'):
+        sha256 = cache['sha256']
+    else:
+        with profile_stage('hash'):
+            sha256 = file_sha256(full_path)
+        profile_bytes('bytesRead', os.path.getsize(full_path))
+    if cache.get('sha256') != sha256:
+        cache = {}
+
+    metadata = cache.get('metadata')
+    thumbnail = cache.get('thumbnail')
+    tiles = cache.get('tiles')
+    placeholder = cache.get('placeholder')
+    phash = cache.get('phash')
+    resolutions = dict(cache.get('resolutions', {}))
+    pending = {
+        preset_id: preset_config for preset_id, preset_config in presets.items()
+        if preset_id not in resolutions
+    }
 
-                    hash_id = generate_short_hash(file_path)
-                    slug = slugify(name_without_ext)
+    if (pending or thumbnail is None or metadata is None or (tiles_config and tiles is None)
+            or (placeholder_config and placeholder is None)
+            or (perceptual_hash_enabled and phash is None)):
+        with Image.open(full_path) as src:
+            profile_bytes('bytesRead', os.path.getsize(full_path))
+            metadata = get_image_metadata(src, full_path)
+            width, height = src.size
+
+            # Presets wider than the source are skipped (never upscaled)
+            for preset_id, preset_config in list(pending.items()):
+                if preset_config['width'] > width:
+                    resolutions[preset_id] = None
+                    del pending[preset_id]
+            size = thumbnail_size(width, height, thumbnail_config['width'], thumbnail_config['height'])
+
+            if max_memory:
+                sizes = [(c['width'], c['height']) for c in pending.values()] + [size]
+                if tiles_config and tiles is None:
+                    sizes.append((width, height))
+                level_size = (
+                    min(max(w for w, _ in sizes), width),
+                    min(max(h for _, h in sizes), height)
+                )
+                with profile_stage('decode'):
+                    img = load_bounded(src, full_path, level_size, max_memory * 1024 * 1024)
+                if img is not src:
+                    src.close()
+            else:
+                with profile_stage('decode'):
+                    src.load()
+                    img = src
+                    if src.mode == 'RGBA':
+                        img = src.convert('RGB')
+                        # Release the RGBA bitmap before resampling
+                        src.close()
+
+            variants, smallest = generate_resolution_variants(
+                img, pending, output_dir, file_path,
+                build_dir=build_dir, hashed_names=hashed_names
+            )
+            built = {variant['id']: variant for variant in variants}
+            for preset_id in pending:
+                if preset_id.lower() in built:
+                    resolutions[preset_id] = built[preset_id.lower()]
+
+            if thumbnail is None:
+                base = smallest if smallest.width >= size[0] and smallest.height >= size[1] else img
+                with profile_stage('thumbnail'):
                     thumbnail = generate_thumbnail(
-                        full_path, thumbnail_config,
-                        os.path.join(root_dir, build_dir), file_path,
-                        build_dir=build_dir
-                    )
-                    resolutions = generate_resolution_variants(
-                        full_path, presets,
-                        os.path.join(root_dir, build_dir), file_path,
-                        build_dir=build_dir
+                        base, thumbnail_config, output_dir, file_path,
+                        build_dir=build_dir, size=size, hashed_names=hashed_names
                     )
 
-                    image_entry = {
-                        'id': hash_id,
-                        'title': title,
-                        'slug': slug,
-                        'thumbnail': thumbnail,
-                        'resolutions': resolutions
-                    }
+            if tiles_config and tiles is None:
+                with profile_stage('tiles'):
+                    tiles = generate_tiles(img, tiles_config, output_dir, file_path,
+                                           build_dir=build_dir, hashed_names=hashed_names)
+
+            if placeholder_config and placeholder is None:
+                with profile_stage('placeholder'):
+                    placeholder = generate_placeholder(smallest, placeholder_config)
+
+            if perceptual_hash_enabled and phash is None:
+                phash = perceptual_hash(smallest)
+
+    outputs = {
+        'sha256': sha256,
+        'metadata': metadata,
+        'thumbnail': thumbnail,
+        'resolutions': resolutions,
+        'tiles': tiles if tiles_config else None,
+        'placeholder': placeholder if placeholder_config else None,
+        'phash': phash
+    }
+    if max_memory:
+        outputs['peakRss'] = peak_rss_mb()
+    if profile:
+        outputs['profile'] = _profile
+    return outputs
 
-                    if include_metadata:
-                        metadata = get_image_metadata(full_path)
-                        if metadata:
-                            image_entry['metadata'] = metadata
 
-                    existing['images'].append(image_entry)
-                    total_images += 1
+def load_build_manifest(manifest_path, images=None):
+    """Load the build cache sidecar, or an empty one if missing or outdated.
 
-                    pbar.update(1)
+    The image records are read one line at a time (see
+    write_build_manifest()) into `images`, which can be any mutable mapping
+    such as an open shelf; a new dict by default.
+    """
+    images = {} if images is None else images
+    try:
+        with open(manifest_path, 'r') as f:
+            try:
+                manifest = json.loads(f.readline() + '}}')
+            except ValueError:
+                # Single-line manifest from an older build
+                f.seek(0)
+                manifest = json.load(f)
+            if manifest.get('version') == BUILD_CACHE_VERSION:
+                images.update(manifest.pop('images'))
+                for line in f:
+                    line = line.rstrip().rstrip(',')
+                    if line != '}}':
+                        images.update(json.loads('{' + line + '}'))
+                manifest['images'] = images
+                return manifest
+    except (OSError, ValueError):
+        images.clear()
+    return {'version': BUILD_CACHE_VERSION, 'images': images}
+
+
+def write_build_manifest(manifest_path, manifest):
+    """Write the build manifest as JSON with one image record per line."""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    header = {key: value for key, value in manifest.items() if key != 'images'}
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(header)[:-1] + ', "images": {')
+        separator = '\n'
+        for file_path, record in manifest['images'].items():
+            f.write(f"{separator}{json.dumps(file_path)}: {json.dumps(record)}")
+            separator = ',\n'
+        f.write('\n}}\n')
+    os.replace(tmp_path, manifest_path)
+
+
+def open_record_shelf(path):
+    """An empty on-disk dict at `path`, replacing any left by a crashed build."""
+    remove_record_shelf(path)
+    return shelve.open(path, 'n')
+
+
+def remove_record_shelf(path):
+    """Delete the files behind a shelf (their suffixes depend on the dbm backend)."""
+    directory, prefix = os.path.split(path)
+    for name in os.listdir(directory):
+        if name.startswith(prefix):
+            os.remove(os.path.join(directory, name))
+
+
+def load_journal_records(journal_path, records=None):
+    """Build records of images finished by an interrupted build.
+
+    Records are collected in `records` (any mutable mapping; a new dict by
+    default). A line cut short by the crash is ignored.
+    """
+    records = {} if records is None else records
+    try:
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if item.get('version') != BUILD_CACHE_VERSION:
+                    continue
+                if item['record'] is None:
+                    records.pop(item['path'], None)
+                else:
+                    records[item['path']] = item['record']
+    except OSError:
+        pass
+    return records
+
+
+def append_journal(journal, seq, section_id, file_path, image_entry, record):
+    """Log a finished image (entry + build record) and flush it to disk.
+
+    A later line for the same `seq` replaces the earlier one; one with no
+    entry and record drops the image again.
+    """
+    journal.write(json.dumps({
+        'version': BUILD_CACHE_VERSION,
+        'seq': seq,
+        'section': section_id,
+        'path': file_path,
+        'entry': image_entry,
+        'record': record
+    }) + '\n')
+    journal.flush()
+
+
+def index_journal(journal_path):
+    """Map section id -> byte offsets of its entries, in discovery order."""
+    lines = {}
+    offset = 0
+    with open(journal_path, 'rb') as f:
+        for line in f:
+            item = json.loads(line)
+            lines.setdefault(item['section'], {})[item['seq']] = offset if item['entry'] is not None else None
+            offset += len(line)
+    return {
+        section_id: [items[seq] for seq in sorted(items) if items[seq] is not None]
+        for section_id, items in lines.items()
+    }
+
+
+def iter_journal_entries(f, offsets):
+    """Yield the image entries stored at `offsets` in an open journal file."""
+    for offset in offsets:
+        f.seek(offset)
+        yield json.loads(f.readline())['entry']
+
+
+def iter_source_images(root_dir, skip_dirs):
+    """Yield (rel_dir, DirEntry) for every source image in one os.scandir pass.
+
+    Directories are visited in the order of a sorted top-down os.walk(): a
+    directory's images first, then its subdirectories. Directories whose
+    name (or path relative to root_dir) is in `skip_dirs` are pruned without
+    being entered. Each DirEntry caches its stat result.
+    """
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root_dir, rel_dir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                child = os.path.join(rel_dir, entry.name)
+                if entry.name not in skip_dirs and child not in skip_dirs and not entry.is_symlink():
+                    subdirs.append(child)
+            elif entry.name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                yield rel_dir, entry
+        stack.extend(reversed(subdirs))
+
+
+def skip_directories(build_dir):
+    """Directory names (and the build dir path) the scanner never enters."""
+    return set(SKIP_DIRS) | {os.path.normpath(build_dir)}
+
+
+def source_snapshot(root_dir, skip_dirs):
+    """Map each source image path to (size, mtime_ns), for change detection."""
+    snapshot = {}
+    for rel_dir, entry in iter_source_images(root_dir, skip_dirs):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue  # removed while scanning
+        snapshot[os.path.join(rel_dir, entry.name)] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def watch_library(root_dir, build_dir, rebuild, interval=2.0, debounce=3.0):
+    """Poll root_dir and call rebuild() after each burst of image changes settles.
+
+    Polling needs no native file-watching dependencies and works on network
+    mounts. A change starts the debounce: the rebuild waits until the set of
+    images (and their sizes and mtimes) has been stable for `debounce`
+    seconds, so half-uploaded files and bursts of uploads become one batch.
+    The rebuild itself is incremental, so only affected images are processed.
+    """
+    skip_dirs = skip_directories(build_dir)
+    snapshot = source_snapshot(root_dir, skip_dirs)
+    print(f"\nWatching {os.path.abspath(root_dir)} for changes every {interval:g}s (Ctrl+C to stop)...")
+    try:
+        while True:
+            time.sleep(interval)
+            current = source_snapshot(root_dir, skip_dirs)
+            if current == snapshot:
+                continue
+
+            settled_at = time.time()
+            while time.time() - settled_at < debounce:
+                time.sleep(min(interval, debounce))
+                latest = source_snapshot(root_dir, skip_dirs)
+                if latest != current:
+                    current, settled_at = latest, time.time()
+
+            added = len(current.keys() - snapshot.keys())
+            removed = len(snapshot.keys() - current.keys())
+            changed = sum(1 for path in current.keys() & snapshot.keys() if current[path] != snapshot[path])
+            print(f"\n[{datetime.now():%H:%M:%S}] {added} added, {changed} changed, {removed} removed - rebuilding...")
+            try:
+                total_images = rebuild()
+                print(f"[{datetime.now():%H:%M:%S}] Library updated ({total_images} images)")
+            except Exception as e:
+                print(f"\nError rebuilding library: {e}")
+            snapshot = current
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+def listing_cache(root_dir):
+    """Return exists(rel_path) backed by one os.scandir listing per directory.
+
+    Cached build outputs sit in a handful of directories; listing each once
+    is much cheaper than a stat per file on network filesystems.
+    """
+    listings = {}
+
+    def exists(rel_path):
+        directory, name = os.path.split(os.path.normpath(rel_path))
+        if directory not in listings:
+            try:
+                with os.scandir(os.path.join(root_dir, directory)) as it:
+                    listings[directory] = {entry.name for entry in it}
+            except OSError:
+                listings[directory] = set()
+        return name in listings[directory]
+
+    return exists
+
+
+def reusable_outputs(record, stat, options, root_dir, exists=None):
+    """Work out which outputs of a cached build record can be kept.
+
+    `options` are the process_image() keyword arguments of this build.
+    Outputs are reusable when their settings signature matches the current
+    config and the file still exists. The source itself is trusted when
+    size and mtime are unchanged; otherwise process_image() re-hashes it.
+    `exists(rel_path)` checks an output path (default: os.path.exists).
+    """
+    if not record:
+        return None
+    if exists is None:
+        exists = lambda rel_path: os.path.exists(os.path.join(root_dir, rel_path))
+
+    presets = options['presets']
+    thumbnail_config = options['thumbnail_config']
+    tiles_config = options['tiles_config']
+    placeholder_config = options['placeholder_config']
+
+    thumbnail = None
+    cached_thumbnail = record.get('thumbnail')
+    if (cached_thumbnail and cached_thumbnail['settings'] == output_signature(thumbnail_config, options)
+            and exists(cached_thumbnail['entry']['path'])):
+        thumbnail = cached_thumbnail['entry']
+
+    resolutions = {}
+    for preset_id, cached in record.get('resolutions', {}).items():
+        preset_config = presets.get(preset_id)
+        if not preset_config or cached['settings'] != output_signature(preset_config, options):
+            continue
+        if cached['entry'] is None:
+            resolutions[preset_id] = None
+        elif all(exists(encoding['path']) for encoding in cached['entry'].get('encodings', [cached['entry']])):
+            resolutions[preset_id] = refresh_variant(cached['entry'], preset_config)
+
+    tiles = None
+    cached_tiles = record.get('tiles')
+    if (tiles_config and cached_tiles and cached_tiles['settings'] == output_signature(tiles_config, options)
+            and exists(tiles_directory(cached_tiles['entry']))):
+        tiles = cached_tiles['entry']
+
+    placeholder = None
+    cached_placeholder = record.get('placeholder')
+    if (placeholder_config and cached_placeholder
+            and cached_placeholder['settings'] == settings_signature(placeholder_config)):
+        placeholder = cached_placeholder['entry']
+
+    return {
+        'sha256': record['sha256'],
+        'trusted': record['size'] == stat.st_size and record['mtimeNs'] == stat.st_mtime_ns,
+        'metadata': record['metadata'],
+        'thumbnail': thumbnail,
+        'resolutions': resolutions,
+        'tiles': tiles,
+        'placeholder': placeholder,
+        'phash': record.get('phash')
+    }
+
+
+def outputs_complete(cache, options):
+    """Whether cached outputs cover everything this build produces."""
+    return bool(
+        cache['thumbnail']
+        and all(preset_id in cache['resolutions'] for preset_id in options['presets'])
+        and (cache['tiles'] or not options['tiles_config'])
+        and (cache['placeholder'] or not options['placeholder_config'])
+        and (cache['phash'] or not options['perceptual_hash_enabled'])
+    )
+
+
+def make_build_record(outputs, stat, options, owner=None):
+    """Turn process_image() outputs into a build manifest record.
+
+    `owner` is the source whose output files a deduplicated image shares
+    (see scan_directory()); it is stored as `outputsOf`.
+    """
+    presets = options['presets']
+    thumbnail = None
+    if outputs['thumbnail']:
+        thumbnail = {'settings': output_signature(options['thumbnail_config'], options), 'entry': outputs['thumbnail']}
+    tiles = None
+    if outputs['tiles']:
+        tiles = {'settings': output_signature(options['tiles_config'], options), 'entry': outputs['tiles']}
+    placeholder = None
+    if outputs['placeholder']:
+        placeholder = {'settings': settings_signature(options['placeholder_config']), 'entry': outputs['placeholder']}
+    record = {
+        'size': stat.st_size,
+        'mtimeNs': stat.st_mtime_ns,
+        'sha256': outputs['sha256'],
+        'metadata': outputs['metadata'],
+        'thumbnail': thumbnail,
+        'resolutions': {
+            preset_id: {'settings': output_signature(presets[preset_id], options), 'entry': entry}
+            for preset_id, entry in outputs['resolutions'].items()
+        },
+        'tiles': tiles,
+        'placeholder': placeholder
+    }
+    if outputs.get('phash'):
+        record['phash'] = outputs['phash']
+    if owner:
+        record['outputsOf'] = owner
+    return record
+
+
+def record_outputs(record):
+    """Paths (relative to the library root) of every file or tile directory a record owns."""
+    paths = set()
+    if record.get('thumbnail'):
+        paths.add(record['thumbnail']['entry']['path'])
+    for cached in record.get('resolutions', {}).values():
+        if cached['entry']:
+            paths.add(cached['entry']['path'])
+            paths.update(encoding['path'] for encoding in cached['entry'].get('encodings', []))
+    if record.get('tiles'):
+        paths.add(tiles_directory(record['tiles']['entry']))
+    return paths
+
+
+def prune_outputs(root_dir, old_manifest, new_manifest):
+    """Delete outputs (and sprite atlases) the previous build wrote that nothing references any more.
+
+    Returns the removed paths.
+    """
+    keep = set()
+    for record in new_manifest['images'].values():
+        keep |= record_outputs(record)
+
+    removed = []
+    for record in old_manifest['images'].values():
+        for path in record_outputs(record) - keep:
+            full_path = os.path.join(root_dir, path)
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path)
+                removed.append(path)
+            elif os.path.exists(full_path):
+                os.remove(full_path)
+                removed.append(path)
+            keep.add(path)
+    for path in set(old_manifest.get('sprites', [])) - set(new_manifest.get('sprites', [])):
+        full_path = os.path.join(root_dir, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+            removed.append(path)
+    return removed
+
+
+def run_image_jobs(image_jobs, options, jobs=1):
+    """Run process_image(*job, **options) for every job, yielding (index, result, error).
+
+    `image_jobs` can be any iterable, including a generator that is still
+    discovering files; jobs are numbered in the order it produces them.
+    With jobs > 1 the work is spread over a process pool, a few jobs per
+    worker are kept in flight while the iterable is consumed, and results
+    are yielded in completion order. A worker that dies takes the whole
+    pool down with it, so unfinished jobs are retried once in a fresh pool
+    before being reported as failed.
+    """
+    if jobs <= 1:
+        for index, job in enumerate(image_jobs):
+            try:
+                yield index, process_image(*job, **options), None
+            except Exception as e:
+                yield index, None, e
+        return
+
+    submitted = {}
+    broken = []
+
+    def collect(done, pending, retry):
+        for future in done:
+            index = pending.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                if retry:
+                    broken.append(index)
+                    continue
+                yield index, None, e
+            except Exception as e:
+                yield index, None, e
+            else:
+                yield index, result, None
+            submitted.pop(index, None)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = {}
+        for index, job in enumerate(image_jobs):
+            submitted[index] = job
+            if broken:
+                # The pool is gone; everything left goes to the retry pool
+                broken.append(index)
+                continue
+            try:
+                pending[executor.submit(process_image, *job, **options)] = index
+            except BrokenProcessPool:
+                broken.append(index)
+                continue
+            if len(pending) >= jobs * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done, pending, retry=True)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done, pending, retry=True)
+
+    if not broken:
+        return
+    retry = sorted(broken)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = {
+            executor.submit(process_image, *submitted[index], **options): index
+            for index in retry
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done, pending, retry=False)
+
+
+def queue_paths(queue_dir):
+    return {name: os.path.join(queue_dir, name) for name in ('jobs', 'claimed', 'results')}
+
+
+def write_json_atomic(path, data):
+    """Write JSON via a uniquely named temp file and a rename (safe on shared filesystems)."""
+    tmp_path = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def run_queue_jobs(image_jobs, options, queue_dir, root_dir, lease=DEFAULT_LEASE, poll=0.5, close=True):
+    """Like run_image_jobs(), but hand the jobs to --worker processes through `queue_dir`.
+
+    The queue is a plain directory on a filesystem every worker can see
+    (NFS, SMB, ...), so no network service is needed. Each job is a file in
+    jobs/; a worker claims it by renaming it into claimed/ (a rename only
+    succeeds once) and keeps touching the claim while it works. Results
+    come back as files in results/. A claim that stops changing for
+    `lease` seconds, as measured on this host, belongs to a dead worker
+    and is moved back to jobs/. A job finished twice only counts once.
+
+    Jobs are queued while `image_jobs` is consumed, and results are
+    yielded as (index, result, error) in completion order. With
+    close=False the workers keep waiting for another batch afterwards; the
+    last batch closes the queue (or call close_queue()).
+    """
+    paths = queue_paths(queue_dir)
+    os.makedirs(queue_dir, exist_ok=True)
+    done_path = os.path.join(queue_dir, QUEUE_DONE)
+    if os.path.exists(done_path):
+        os.remove(done_path)
+    for directory in paths.values():
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+    build_id = uuid.uuid4().hex
+    write_json_atomic(os.path.join(queue_dir, QUEUE_FILE), {
+        'build': build_id,
+        'root': os.path.abspath(root_dir),
+        'lease': lease,
+        'options': {key: value for key, value in options.items() if key != 'output_dir'}
+    })
+    print(f"Queued jobs in {queue_dir}; start workers with: python build_library.py --worker {queue_dir}")
+
+    queued = 0
+    finished = set()
+    claims = {}  # claim file -> (last mtime seen, local time it last changed)
+
+    def collect():
+        for name in os.listdir(paths['results']):
+            if not name.endswith('.json'):
+                continue
+            result_path = os.path.join(paths['results'], name)
+            try:
+                with open(result_path, 'r') as f:
+                    item = json.load(f)
+            except (OSError, ValueError):
+                continue  # still being renamed into place
+            os.remove(result_path)
+            index = item['index']
+            if item.get('build') != build_id or index in finished:
+                continue
+            finished.add(index)
+            if item.get('error') is not None:
+                yield index, None, RuntimeError(f"{item['error']} (worker {item['worker']})")
+            else:
+                yield index, item['result'], None
+
+    def requeue_expired():
+        now = time.time()
+        for name in os.listdir(paths['claimed']):
+            claim_path = os.path.join(paths['claimed'], name)
+            job_name = name.split('@')[0] + '.json'
+            try:
+                mtime = os.stat(claim_path).st_mtime
+            except OSError:
+                claims.pop(name, None)
+                continue
+            if int(job_name.split('.')[0]) in finished:
+                os.remove(claim_path)
+                claims.pop(name, None)
+                continue
+            seen = claims.get(name)
+            if seen is None or seen[0] != mtime:
+                claims[name] = (mtime, now)
+            elif now - seen[1] > lease:
+                try:
+                    os.rename(claim_path, os.path.join(paths['jobs'], job_name))
+                    tqdm.write(f"Re-queued job {job_name}: lease of worker {name.split('@')[1][:-5]} expired")
+                except OSError:
+                    pass
+                claims.pop(name, None)
+
+    last_poll = time.time()
+    for index, (full_path, file_path, cache) in enumerate(image_jobs):
+        write_json_atomic(os.path.join(paths['jobs'], f"{index:08d}.json"), {
+            'build': build_id, 'index': index, 'path': file_path, 'cache': cache
+        })
+        queued += 1
+        if time.time() - last_poll >= poll:
+            yield from collect()
+            last_poll = time.time()
+
+    while len(finished) < queued:
+        yield from collect()
+        requeue_expired()
+        if len(finished) < queued:
+            time.sleep(poll)
+
+    if close:
+        close_queue(queue_dir, build_id)
+
+
+def close_queue(queue_dir, build_id=''):
+    """Tell the --worker processes of a run_queue_jobs() queue that the build is done."""
+    with open(os.path.join(queue_dir, QUEUE_DONE), 'w') as f:
+        f.write(build_id)
+
+
+def queue_worker(queue_dir, root_dir=None, poll=1.0):
+    """Claim and process jobs from a run_queue_jobs() queue until the build is done.
+
+    `root_dir` is the library root as mounted on this host (default: the
+    coordinator's path). Returns the number of jobs processed.
+    """
+    paths = queue_paths(queue_dir)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    while True:
+        try:
+            with open(os.path.join(queue_dir, QUEUE_FILE), 'r') as f:
+                queue = json.load(f)
+        except (OSError, ValueError):
+            time.sleep(poll)
+            continue
+        if os.path.exists(os.path.join(queue_dir, QUEUE_DONE)):
+            return processed
+
+        claimed = None
+        for name in sorted(os.listdir(paths['jobs'])) if os.path.isdir(paths['jobs']) else []:
+            if not name.endswith('.json'):
+                continue
+            claim_path = os.path.join(paths['claimed'], f"{name[:-5]}@{worker}.json")
+            try:
+                os.rename(os.path.join(paths['jobs'], name), claim_path)
+            except OSError:
+                continue  # another worker got it first
+            claimed = claim_path
+            break
+        if claimed is None:
+            time.sleep(poll)
+            continue
+
+        with open(claimed, 'r') as f:
+            job = json.load(f)
+        root = root_dir or queue['root']
+        options = dict(queue['options'], output_dir=os.path.join(root, queue['options']['build_dir']))
+
+        # Keep the lease alive while the image is being processed
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(max(queue['lease'] / 4, 1)):
+                try:
+                    os.utime(claimed)
+                except OSError:
+                    return  # re-queued by the coordinator
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        item = {'build': job['build'], 'index': job['index'], 'worker': worker, 'result': None, 'error': None}
+        try:
+            item['result'] = process_image(os.path.join(root, job['path']), job['path'], job['cache'], **options)
+        except Exception as e:
+            item['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            stop.set()
+            beat.join()
+
+        write_json_atomic(os.path.join(paths['results'], f"{job['index']:08d}@{worker}.json"), item)
+        try:
+            os.remove(claimed)
+        except OSError:
+            pass
+        processed += 1
+        print(f"[{worker}] {job['path']}: {'failed - ' + item['error'] if item['error'] else 'done'}")
+
+
+def apply_outputs(image_entry, outputs, presets, include_metadata=True):
+    """Fill an image entry from process_image() outputs."""
+    image_entry['thumbnail'] = outputs['thumbnail']
+    image_entry['resolutions'] = [
+        outputs['resolutions'][preset_id] for preset_id, _ in sort_presets(presets)
+        if outputs['resolutions'].get(preset_id)
+    ]
+    if outputs.get('tiles'):
+        image_entry['tiles'] = outputs['tiles']
+    if outputs.get('placeholder'):
+        image_entry['placeholder'] = outputs['placeholder']
+    if include_metadata and outputs['metadata']:
+        image_entry['metadata'] = outputs['metadata']
+
+
+def scan_directory(root_dir, presets, thumbnail_config, default_template, include_metadata=True, site_config=None, build_dir='_BUILD', jobs=1, force=False, max_memory=None, tiles_config=None, stream=False, placeholder_config=None, profile=None, dedup=True, perceptual_hash_enabled=False, hashed_names=False, changes=None, queue_dir=None, lease=DEFAULT_LEASE, sprite_config=None, only_presets=None, on_progress=None):
+    """Scan directory for images and build v4.0 library structure.
+
+    The tree is listed once with os.scandir (see iter_source_images()), which
+    also sizes the progress bar; the cache checks, hashing and dispatch of
+    each image then run while earlier images are encoding. Entries keep
+    their discovery order, so the output is identical whether images are
+    processed serially or with --jobs.
+
+    Outputs recorded in the build manifest (BUILD_MANIFEST inside build_dir)
+    are reused when the source and the relevant settings are unchanged, and
+    outputs no source references any more are deleted. `force` ignores the
+    manifest and regenerates everything.
+
+    `max_memory` (MB) enables the low-memory decode path for every image
+    and reports the peak RSS observed. `tiles_config` adds a tile pyramid
+    per image (see generate_tiles()), `placeholder_config` an inline
+    BlurHash/LQIP (see generate_placeholder()). When `profile` is a list,
+    the stage timings of every processed image are appended to it.
+    `perceptual_hash_enabled` stores a dHash per image in the build manifest
+    for find_near_duplicates(). `hashed_names` puts a content hash in every
+    output filename; switching it re-encodes (and renames) the outputs.
+    When `changes` is a dict of 'written' and 'removed' sets, the output
+    paths this build wrote or deleted are added to them.
+
+    `sprite_config` packs each section's thumbnails into sprite atlases (see
+    write_sprite_atlases()) and adds a `sprite` to every thumbnail entry.
+
+    `only_presets` (preset ids) makes this the first phase of a priority
+    build: images that need work get just those presets, the thumbnail,
+    metadata and placeholder, and every other output still valid from the
+    last build is kept; a later full build adds the rest. `on_progress` is
+    called with the sections after each processed image (not with
+    `stream`); entries still waiting for their job show their cached
+    outputs meanwhile, so the sections are always publishable.
+
+    With `queue_dir`, the images are encoded by --worker processes (on this
+    or other hosts) through a shared-directory queue instead of a local
+    pool; see run_queue_jobs(). Results are merged in discovery order, so
+    the library is the same as a local build.
+
+    With `dedup`, images with byte-identical content are encoded once: the
+    first one found owns the output files and the others share them, with
+    `outputsOf` in their build record naming the owner. An image whose
+    owner has since changed content is re-encoded under its own name.
+
+    Every finished image is appended to the build journal (BUILD_JOURNAL in
+    build_dir) as it completes, so an interrupted build resumes from the
+    images it already finished. With `stream`, image entries are left out of
+    the returned sections and live only in the journal, for
+    write_streamed_library() to assemble, and build records are kept in
+    on-disk shelves (BUILD_RECORDS) instead of dicts; otherwise the journal
+    is removed once the manifest is written.
+    """
+    sections = []
+    image_count = 0
+
+    options = {
+        'presets': presets,
+        'thumbnail_config': thumbnail_config,
+        'output_dir': os.path.join(root_dir, build_dir),
+        'build_dir': build_dir,
+        'max_memory': max_memory,
+        'tiles_config': tiles_config,
+        'placeholder_config': placeholder_config,
+        'profile': profile is not None,
+        'perceptual_hash_enabled': perceptual_hash_enabled,
+        'hashed_names': hashed_names
+    }
+
+    manifest_path = os.path.join(root_dir, build_dir, BUILD_MANIFEST)
+    records_path = os.path.join(root_dir, build_dir, BUILD_RECORDS)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    shelves = {}
+    if stream:
+        # Build records are kept on disk too, so memory does not grow with them
+        shelves = {name: open_record_shelf(f"{records_path}.{name}") for name in ('old', 'new', 'recovered', 'shared')}
+    old_manifest = load_build_manifest(manifest_path, images=shelves.get('old'))
+    new_manifest = {'version': BUILD_CACHE_VERSION, 'images': shelves.get('new', {})}
+
+    job_options = options
+    if only_presets is not None:
+        # Tiles are the most expensive output; they wait for the full build
+        job_options = {
+            **options,
+            'presets': {preset_id: presets[preset_id] for preset_id in only_presets},
+            'tiles_config': None
+        }
+
+    journal_path = os.path.join(root_dir, build_dir, BUILD_JOURNAL)
+    if not force:
+        recovered = load_journal_records(journal_path, shelves.get('recovered'))
+        if recovered:
+            print(f"Resuming interrupted build: {len(recovered)} image(s) already finished")
+            old_manifest['images'].update(recovered)
+    journal = open(journal_path, 'w')
+
+    skip_dirs = skip_directories(build_dir)
+    exists = listing_cache(root_dir)
+    sections_by_id = {}
+    overrides_by_name = {}
+    job_entries = {}
+    job_count = 0
+    reused = 0
+    # sha256 -> owner path and its outputs once known, and the images waiting on them
+    shared = shelves.get('shared', {})
+    waiting = {}
+    job_shas = {}
+    job_tiles = {}
+    aliases = {}
+    failed = []
+    peak_rss = None
+
+    def finish(entry, outputs, owner=None):
+        seq, section, image_entry, stat, file_path = entry
+        apply_outputs(image_entry, outputs, presets, include_metadata)
+        new_record = make_build_record(outputs, stat, options, owner=owner)
+        new_manifest['images'][file_path] = new_record
+        append_journal(journal, seq, section['id'], file_path, image_entry, new_record)
+        if owner:
+            aliases[file_path] = entry
+
+    def fail(entry, error):
+        seq, section, image_entry, stat, file_path = entry
+        tqdm.write(f"Error processing {file_path}: {error}")
+        if file_path in new_manifest['images']:
+            # Already journaled as a duplicate; drop that line again
+            del new_manifest['images'][file_path]
+            append_journal(journal, seq, section['id'], file_path, None, None)
+        if not stream:
+            section['images'].remove(image_entry)
+        failed.append(file_path)
+
+    def handle(entry, result, error):
+        nonlocal peak_rss
+        file_path = entry[4]
+        tiles = job_tiles.pop(file_path, None)
+        if error is None and tiles and not result['tiles'] and tiles[0] == result['sha256']:
+            # Left alone by an only_presets job; keep it in the record
+            result = {**result, 'tiles': tiles[1]}
+        sha256 = job_shas.pop(file_path, None)
+        followers = waiting.pop(sha256, [])
+        if error is not None:
+            # Identical bytes would fail the same way
+            fail(entry, error)
+            for follower in followers:
+                fail(follower, error)
+            return
+        finish(entry, result)
+        if sha256:
+            shared[sha256] = {'owner': file_path, 'outputs': result}
+        for follower in followers:
+            finish(follower, result, owner=file_path)
+        if result.get('peakRss') is not None:
+            peak_rss = max(peak_rss or 0, result['peakRss'])
+        if profile is not None:
+            profile.append({'path': file_path, **result['profile']})
+
+    def prepare():
+        """Yield (entry, full_path, cache, owner, sha256 future) in discovery order."""
+        nonlocal image_count
+        for rel_dir, dir_entry in candidates:
+            path_parts = rel_dir.split(os.sep) if rel_dir else []
+            section_name = path_parts[0] if path_parts else 'Root'
+            section_id = slugify(section_name)
+
+            if section_name not in overrides_by_name:
+                overrides_by_name[section_name] = (site_config or {}).get('sections', {}).get(section_name, {})
+            section_overrides = overrides_by_name[section_name]
+
+            section = sections_by_id.get(section_id)
+            if section is None:
+                section = {
+                    'id': section_id,
+                    'title': section_overrides.get('title', section_name),
+                    'template': section_overrides.get('template', default_template),
+                    'icon': section_overrides.get('icon', 'folder'),
+                    'images': []
+                }
+                sections_by_id[section_id] = section
+                sections.append(section)
 
-            pbar.update(len(filenames) - len(image_files))
+            image_file = dir_entry.name
+            name_without_ext = os.path.splitext(image_file)[0]
 
-    return sections, total_images
+            # Clean title using section overrides
+            title = clean_title(name_without_ext, section_overrides)
 
+            file_path = os.path.join(rel_dir, image_file).replace(os.sep, '/') if rel_dir else image_file
+            full_path = os.path.join(root_dir, file_path)
 
-def build_library(sections, total_images, context=None):
-    """Build v4.0 library.json structure."""
+            image_entry = {
+                'id': generate_short_hash(file_path),
+                'title': title,
+                'slug': slugify(name_without_ext),
+                'thumbnail': None,
+                'resolutions': []
+            }
+            if not stream:
+                section['images'].append(image_entry)
+            seq = image_count
+            image_count += 1
+
+            stat = dir_entry.stat()
+            entry = (seq, section, image_entry, stat, file_path)
+            record = None if force else old_manifest['images'].get(file_path)
+            cache = reusable_outputs(record, stat, options, root_dir, exists=exists)
+            owner = record.get('outputsOf') if record else None
+
+            if cache and owner and not (cache['trusted'] and outputs_complete(cache, options)):
+                # Never top up output files another image owns
+                cache = None
+            future = None
+            if dedup and not (cache and cache['trusted']):
+                # Hash before dispatch rather than in the worker, so
+                # duplicates are spotted before anything is encoded
+                future = hasher.submit(file_sha256, full_path)
+            yield entry, full_path, cache, owner, future
+
+    def discover():
+        """Yield process_image() jobs in discovery order; cached images are finished inline."""
+        nonlocal job_count, reused
+        prepared = prepare()
+        ahead = deque(islice(prepared, HASH_LOOKAHEAD))
+        while ahead:
+            entry, full_path, cache, owner, future = ahead.popleft()
+            ahead.extend(islice(prepared, 1))
+            file_path = entry[4]
+            image_entry = entry[2]
+            if future is not None:
+                sha256 = future.result()
+                if cache and cache['sha256'] == sha256:
+                    cache['trusted'] = True
+                else:
+                    cache = {
+                        'sha256': sha256, 'trusted': True, 'metadata': None, 'thumbnail': None,
+                        'resolutions': {}, 'tiles': None, 'placeholder': None, 'phash': None
+                    }
+
+            if cache and cache['trusted'] and outputs_complete(cache, options):
+                finish(entry, cache, owner=owner)
+                if dedup:
+                    shared.setdefault(cache['sha256'], {'owner': owner or file_path, 'outputs': cache})
+                reused += 1
+                update_progress()
+                continue
+
+            if on_progress and cache and not stream:
+                apply_outputs(image_entry, cache, presets, include_metadata)
+            if dedup:
+                known = shared.get(cache['sha256'])
+                if known is None:
+                    shared[cache['sha256']] = {'owner': file_path, 'outputs': None}
+                    waiting[cache['sha256']] = []
+                    job_shas[file_path] = cache['sha256']
+                elif known['outputs'] is not None:
+                    finish(entry, known['outputs'], owner=known['owner'])
+                    update_progress()
+                    continue
+                else:
+                    waiting[cache['sha256']].append(entry)
+                    continue
+
+            if only_presets is not None and cache and cache['tiles']:
+                job_tiles[file_path] = (cache['sha256'], cache['tiles'])
+
+            # run_image_jobs() numbers jobs in the order they are yielded
+            job_entries[job_count] = entry
+            job_count += 1
+            yield (full_path, file_path, cache)
+
+    def update_progress():
+        # Duplicates finish along with their owner, failures are done too
+        pbar.update(len(new_manifest['images']) + len(failed) - pbar.n)
+
+    candidates = list(iter_source_images(root_dir, skip_dirs))
+    pbar = tqdm(total=len(candidates), desc="Processing images")
+    with ThreadPoolExecutor(HASH_THREADS) as hasher:
+        if queue_dir:
+            # Left open for the duplicates re-encoded below
+            results = run_queue_jobs(discover(), job_options, queue_dir, root_dir, lease=lease, close=False)
+        else:
+            results = run_image_jobs(discover(), job_options, jobs=jobs)
+        for index, result, error in results:
+            # Finished entries live in the journal (and the sections) from here on
+            handle(job_entries.pop(index), result, error)
+            update_progress()
+            if on_progress and not stream:
+                on_progress(sections)
+
+    # A duplicate reused from the cache may share files with an owner that
+    # was re-encoded with different content in this build
+    stale = []
+    for file_path, entry in aliases.items():
+        record = new_manifest['images'].get(file_path)
+        owner_record = new_manifest['images'].get(record['outputsOf']) if record else None
+        if owner_record and not owner_record.get('outputsOf') and owner_record['sha256'] != record['sha256']:
+            stale.append(entry)
+    if stale:
+        tqdm.write(f"Re-encoding {len(stale)} duplicate image(s) whose original changed")
+        pbar.total += len(stale)
+        pbar.refresh()
+        rebuild = []
+        for sha256 in {new_manifest['images'][entry[4]]['sha256'] for entry in stale}:
+            shared.pop(sha256, None)
+        for entry in stale:
+            file_path = entry[4]
+            sha256 = new_manifest['images'][file_path]['sha256']
+            # Still the changed original's pyramid; a phase 1 job leaves tiles out
+            entry[2].pop('tiles', None)
+            if sha256 in shared:
+                waiting[sha256].append(entry)
+                continue
+            shared[sha256] = {'owner': file_path, 'outputs': None}
+            waiting[sha256] = []
+            job_shas[file_path] = sha256
+            rebuild.append(entry)
+        rebuild_jobs = [
+            (os.path.join(root_dir, entry[4]), entry[4], {'sha256': job_shas[entry[4]], 'trusted': True})
+            for entry in rebuild
+        ]
+        if queue_dir:
+            results = run_queue_jobs(rebuild_jobs, job_options, queue_dir, root_dir, lease=lease)
+        else:
+            results = run_image_jobs(rebuild_jobs, job_options, jobs=jobs)
+        for index, result, error in results:
+            entry = rebuild[index]
+            # The duplicates waiting on this one finish with it
+            pbar.update(1 + len(waiting.get(job_shas.get(entry[4]), [])))
+            handle(entry, result, error)
+            if on_progress and not stream:
+                on_progress(sections)
+    elif queue_dir:
+        close_queue(queue_dir)
+    pbar.close()
+
+    if reused:
+        print(f"Reused cached outputs for {reused} unchanged image(s)")
+    duplicates = sum(1 for record in new_manifest['images'].values() if record.get('outputsOf'))
+    if duplicates:
+        print(f"Shared outputs for {duplicates} duplicate image(s)")
+
+    if peak_rss is not None:
+        print(f"Peak memory: {peak_rss} MB per process (budget {max_memory} MB per image)")
+
+    if failed:
+        print(f"\nWarning: {len(failed)} image(s) failed and were left out of the library:")
+        for file_path in failed:
+            print(f"  - {file_path}")
+
+    sprites_written = []
+    if sprite_config:
+        new_manifest['sprites'] = []
+        journal.flush()
+        offsets = index_journal(journal_path) if stream else {}
+        for section in sections:
+            if stream:
+                with open(journal_path, 'r') as f:
+                    items = []
+                    for offset in offsets.get(section['id'], []):
+                        f.seek(offset)
+                        items.append(json.loads(f.readline()))
+            else:
+                items = [{'entry': image_entry} for image_entry in section['images']]
+            items = [item for item in items if item['entry']['thumbnail']]
+            if not items:
+                continue
+            sprites, atlases, written = write_sprite_atlases(
+                root_dir, [item['entry']['thumbnail'] for item in items], sprite_config,
+                os.path.join(root_dir, build_dir), section['id'], build_dir=build_dir, hashed_names=hashed_names
+            )
+            for item, sprite in zip(items, sprites):
+                item['entry']['thumbnail'] = {**item['entry']['thumbnail'], 'sprite': sprite}
+                if stream:
+                    append_journal(journal, item['seq'], item['section'], item['path'], item['entry'], item['record'])
+            new_manifest['sprites'].extend(atlases)
+            sprites_written.extend(written)
+        print(f"Packed thumbnails into {len(new_manifest['sprites'])} sprite atlas(es)")
+
+    removed = prune_outputs(root_dir, old_manifest, new_manifest)
+    if removed:
+        print(f"Removed {len(removed)} stale output file(s)")
+    if changes is not None:
+        # Outputs of every record that differs from the last build's
+        # (a superset of the files actually rewritten)
+        for file_path, record in new_manifest['images'].items():
+            if old_manifest['images'].get(file_path) != record:
+                changes['written'].update(record_outputs(record))
+        changes['written'].update(sprites_written)
+        changes['removed'].update(removed)
+    write_build_manifest(manifest_path, new_manifest)
+    journal.close()
+    if not stream:
+        os.remove(journal_path)
+    for name, shelf in shelves.items():
+        shelf.close()
+        remove_record_shelf(f"{records_path}.{name}")
+
+    return sections, image_count - len(failed)
+
+
+def print_profile_summary(records, wall_seconds, top=10):
+    """Print per-stage totals and the slowest images of a --profile build."""
+    print(f"\n{'=' * 60}")
+    print(f"Build profile: {len(records)} image(s) processed in {wall_seconds:.2f}s wall time")
+    print(f"{'=' * 60}")
+    if not records:
+        print("Every image came from the build cache; run with --force to profile them.")
+        return
+
+    totals = {}
+    for record in records:
+        for name, _, seconds in record['stages']:
+            totals[name] = totals.get(name, 0.0) + seconds
+    stage_time = sum(totals.values()) or 1.0
+    print(f"\n{'Stage':<14}{'Total (s)':>12}{'Share':>9}")
+    for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"{name:<14}{seconds:>12.2f}{seconds / stage_time:>9.0%}")
+
+    read = sum(record['bytesRead'] for record in records)
+    written = sum(record['bytesWritten'] for record in records)
+    print(f"\nRead {read / 1024 / 1024:.1f} MB, wrote {written / 1024 / 1024:.1f} MB")
+
+    def image_seconds(record):
+        return sum(seconds for _, _, seconds in record['stages'])
+
+    print(f"\nSlowest images:")
+    print(f"{'Seconds':>9}  {'Slowest stage':<22}Image")
+    for record in sorted(records, key=image_seconds, reverse=True)[:top]:
+        stages = {}
+        for name, _, seconds in record['stages']:
+            stages[name] = stages.get(name, 0.0) + seconds
+        slowest = max(stages.items(), key=lambda item: item[1]) if stages else ('-', 0.0)
+        print(f"{image_seconds(record):>9.2f}  {f'{slowest[0]} ({slowest[1]:.2f}s)':<22}{record['path']}")
+
+
+def write_chrome_trace(records, trace_file, build_start):
+    """Write stage timings as Chrome trace events (chrome://tracing, Perfetto)."""
+    events = []
+    for record in records:
+        for name, start, seconds in record['stages']:
+            events.append({
+                'name': name,
+                'cat': 'image',
+                'ph': 'X',
+                'ts': round((start - build_start) * 1e6),
+                'dur': round(seconds * 1e6),
+                'pid': record['pid'],
+                'tid': record['pid'],
+                'args': {'image': record['path']}
+            })
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f"Chrome trace written to: {trace_file}")
+
+
+def find_near_duplicates(images, threshold=6):
+    """Pairs of images whose perceptual hashes differ in at most `threshold` bits.
+
+    `images` maps path -> build record (with `phash`). By the pigeonhole
+    principle two hashes within `threshold` bits agree exactly on at least
+    one of `threshold + 1` bands, so only images sharing a band value are
+    compared. Byte-identical pairs are left out; they are exact duplicates.
+    """
+    hashes = {path: int(record['phash'], 16) for path, record in images.items() if record.get('phash')}
+    bands = min(threshold + 1, 64)
+    width = 64 // bands
+    candidates = set()
+    for band in range(bands):
+        shift = band * width
+        mask = (1 << (64 - shift if band == bands - 1 else width)) - 1
+        buckets = {}
+        for path, value in hashes.items():
+            buckets.setdefault((value >> shift) & mask, []).append(path)
+        for paths in buckets.values():
+            for i, a in enumerate(paths):
+                for b in paths[i + 1:]:
+                    candidates.add((a, b) if a < b else (b, a))
+
+    pairs = []
+    for a, b in sorted(candidates):
+        distance = bin(hashes[a] ^ hashes[b]).count('1')
+        if distance <= threshold and images[a]['sha256'] != images[b]['sha256']:
+            pairs.append({'a': a, 'b': b, 'distance': distance})
+    return sorted(pairs, key=lambda pair: pair['distance'])
+
+
+def write_duplicates_report(manifest_path, report_file, threshold=6):
+    """Write exact and near-duplicate groups found in the build manifest."""
+    images = load_build_manifest(manifest_path)['images']
+    by_sha = {}
+    for path, record in sorted(images.items()):
+        by_sha.setdefault(record['sha256'], []).append(path)
+    exact = [paths for paths in by_sha.values() if len(paths) > 1]
+    near = find_near_duplicates(images, threshold)
+
+    with open(report_file, 'w') as f:
+        json.dump({'threshold': threshold, 'exact': exact, 'near': near}, f, indent=2)
+    print(f"Duplicates: {len(exact)} exact group(s), {len(near)} near-duplicate pair(s) "
+          f"(threshold {threshold} bits) -> {report_file}")
+    for pair in near[:10]:
+        print(f"  {pair['distance']:2d}  {pair['a']}  ~  {pair['b']}")
+
+
+def output_mime(path):
+    """MIME type of a build output, from its extension."""
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    for _, format_extension, mime in IMAGE_FORMATS.values():
+        if extension == format_extension:
+            return mime
+    return 'application/octet-stream'
+
+
+def write_asset_manifest(root_dir, manifest_path, asset_file):
+    """Write path -> sha256, size and MIME type of every build output.
+
+    Paths are relative to the library root, like those in library.json;
+    tile pyramids are listed file by file. With hashed filenames a path's
+    content never changes, so entries of the previous asset manifest are
+    kept as they are and only new files are read.
+    """
+    previous = {}
+    try:
+        with open(asset_file, 'r') as f:
+            previous = json.load(f).get('assets', {})
+    except (OSError, ValueError):
+        pass
+
+    manifest = load_build_manifest(manifest_path)
+    paths = set(manifest.get('sprites', []))
+    for record in manifest['images'].values():
+        for path in record_outputs(record):
+            full_path = os.path.join(root_dir, path)
+            if not os.path.isdir(full_path):
+                paths.add(path)
+                continue
+            for dirpath, _, filenames in os.walk(full_path):
+                rel_dir = os.path.relpath(dirpath, root_dir).replace(os.sep, '/')
+                paths.update(f"{rel_dir}/{name}" for name in filenames)
+
+    assets = {}
+    hashed = 0
+    for path in sorted(paths):
+        if path in previous:
+            assets[path] = previous[path]
+            continue
+        full_path = os.path.join(root_dir, path)
+        if not os.path.exists(full_path):
+            continue
+        assets[path] = {
+            'hash': file_sha256(full_path),
+            'size': os.path.getsize(full_path),
+            'mime': output_mime(path)
+        }
+        hashed += 1
+
+    tmp_path = f"{asset_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': 1, 'assets': assets}, f, indent=2)
+    os.replace(tmp_path, asset_file)
+    print(f"Asset manifest written to: {asset_file} ({len(assets)} assets, {hashed} new)")
+
+
+def preset_table(presets):
+    """Preset fields every resolution entry repeats, keyed by variant id (--normalize)."""
+    table = {}
+    for preset_id, preset_config in sort_presets(presets):
+        preset = {
+            'label': preset_config['label'],
+            'width': preset_config['width'],
+            'height': preset_config['height'],
+            'quality': preset_config['quality'],
+            'recommended': preset_config['recommended'],
+            'bandwidth': preset_config['bandwidth']
+        }
+        budget = preset_byte_budget(preset_config)
+        if budget:
+            preset['maxBytes'] = budget
+        if preset_config.get('default', False):
+            preset['default'] = True
+        table[preset_id.lower()] = preset
+    return table
+
+
+def normalize_entry(image_entry, presets):
+    """Strip resolution fields that equal the top-level `presets` table.
+
+    Clients rebuild a full entry as {...presets[r.id], ...r}, so a field is
+    kept only where it differs, e.g. the quality a byte budget settled on.
+    """
+    resolutions = []
+    for variant in image_entry.get('resolutions', []):
+        preset = presets.get(variant['id'], {})
+        resolutions.append({
+            key: value for key, value in variant.items()
+            if key == 'id' or key not in preset or preset[key] != value
+        })
+    return {**image_entry, 'resolutions': resolutions}
+
+
+def normalize_sections(library):
+    """Sections with normalize_entry() applied, when the library has a preset table."""
+    if not library.get('presets'):
+        return library['sections']
+    return [
+        {**section, 'images': [normalize_entry(image, library['presets']) for image in section['images']]}
+        if 'images' in section else section
+        for section in library['sections']
+    ]
+
+
+def write_precompressed(path, enabled=True):
+    """Write gzip (and, with the brotli module, brotli) siblings of a finished file.
+
+    Static servers (nginx gzip_static/brotli_static, Netlify) serve them
+    instead of compressing on every request. Output is deterministic, so
+    unchanged files produce unchanged siblings. With `enabled` false, any
+    siblings from an earlier build are removed so they cannot go stale.
+    """
+    codecs = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        codecs.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    if not enabled:
+        for suffix in ('.gz', '.br'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    for suffix, compress in codecs:
+        tmp_path = f"{path}{suffix}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compress(data))
+        os.replace(tmp_path, path + suffix)
+    if brotli is None and os.path.exists(path + '.br'):
+        os.remove(path + '.br')
+
+
+def build_library(sections, total_images, context=None, presets=None):
+    """Build v4.0 library.json structure.
+
+    With `presets` (see preset_table()) the library uses the normalized
+    layout: preset fields live once at the top level and are stripped from
+    every resolution entry when the library is written.
+    """
     if context is None:
         context = {
             'type': 'local',
@@ -331,26 +2564,153 @@ def build_library(sections, total_images, context=None):
             'theme': 'auto'
         }
 
-    return {
+    library = {
         'version': '4.0.0',
-        'context': context,
-        'sections': sections,
-        'meta': {
-            'totalImages': total_images,
-            'generated': datetime.now().isoformat()
-        }
+        'context': context
+    }
+    if presets:
+        library['presets'] = presets
+    library['sections'] = sections
+    library['meta'] = {
+        'totalImages': total_images,
+        'generated': datetime.now().isoformat()
     }
+    return library
 
 
-def write_library_json(library, output_file, pretty=True):
-    with open(output_file, 'w') as f:
+def write_library_json(library, output_file, pretty=True, precompress=False):
+    library = {**library, 'sections': normalize_sections(library)}
+    # Write to a temp file and rename so readers never see a half-written library
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w') as f:
         if pretty:
             json.dump(library, f, indent=2)
         else:
             json.dump(library, f)
+    os.replace(tmp_path, output_file)
+    write_precompressed(output_file, precompress)
     print(f"Library written to: {output_file}")
 
 
+def write_streamed_library(library, journal_path, output_file, pretty=True, precompress=False):
+    """Assemble library.json from the build journal one entry at a time.
+
+    `library` carries the section summaries without images; each section's
+    images are copied from the journal in discovery order, so memory use
+    does not grow with the size of the gallery. The output matches
+    write_library_json() byte for byte and is written to a temp file that is
+    renamed into place, so a failed write never leaves a truncated library.
+    """
+    marker = '\x00images\x00'
+    skeleton = {**library, 'sections': [{**s, 'images': marker} for s in library['sections']]}
+    parts = json.dumps(skeleton, indent=2 if pretty else None).split(json.dumps(marker))
+    index = index_journal(journal_path)
+
+    # Pretty output nests image entries four levels deep (root > sections > section > images)
+    item_indent = '\n' + ' ' * 8
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w') as f, open(journal_path, 'r') as journal:
+        f.write(parts[0])
+        for section, tail in zip(library['sections'], parts[1:]):
+            offsets = index.get(section['id'], [])
+            if not offsets:
+                f.write('[]')
+            else:
+                f.write('[' + (item_indent if pretty else ''))
+                for i, entry in enumerate(iter_journal_entries(journal, offsets)):
+                    if library.get('presets'):
+                        entry = normalize_entry(entry, library['presets'])
+                    if i:
+                        f.write(',' + item_indent if pretty else ', ')
+                    if pretty:
+                        f.write(json.dumps(entry, indent=2).replace('\n', item_indent))
+                    else:
+                        f.write(json.dumps(entry))
+                f.write('\n' + ' ' * 6 + ']' if pretty else ']')
+            f.write(tail)
+    os.replace(tmp_path, output_file)
+    write_precompressed(output_file, precompress)
+    print(f"Library written to: {output_file}")
+
+
+def shards_directory(output_file):
+    """Directory holding the shard files of a sharded library."""
+    output_path = Path(output_file)
+    return output_path.with_name(f"{output_path.stem}-shards")
+
+
+def write_sharded_library(library, output_file, pretty=True, shard_size=0, journal_path=None, precompress=False):
+    """Write a small root index plus one JSON shard per section (or page).
+
+    The root keeps context, meta and section summaries with image counts;
+    each section lists its shard URLs (relative to the root file) and
+    content hashes so clients can fetch and cache shards on demand.
+    ``shard_size`` paginates sections into pages of that many images
+    (0 = one shard per section). Shard filenames embed the content hash,
+    and shards from previous builds are removed.
+
+    With `journal_path` (--stream), section images are read from the build
+    journal one section at a time instead of from `library`. `precompress`
+    adds .gz/.br siblings to the root and every shard.
+    """
+    indent = 2 if pretty else None
+    shard_dir = shards_directory(output_file)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    index = index_journal(journal_path) if journal_path else None
+    journal = open(journal_path, 'r') if journal_path else None
+
+    written = set()
+    root_sections = []
+    for section in library['sections']:
+        if journal:
+            images = list(iter_journal_entries(journal, index.get(section['id'], [])))
+        else:
+            images = section.get('images', [])
+        if library.get('presets'):
+            images = [normalize_entry(image, library['presets']) for image in images]
+        page_size = shard_size if shard_size > 0 else max(len(images), 1)
+        pages = [images[i:i + page_size] for i in range(0, len(images), page_size)] or [[]]
+
+        shards = []
+        for page, page_images in enumerate(pages):
+            payload = json.dumps({
+                'version': library['version'],
+                'section': section['id'],
+                'page': page,
+                'images': page_images
+            }, indent=indent)
+            digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+            suffix = f"-{page}" if len(pages) > 1 else ''
+            shard_name = f"{section['id']}{suffix}.{digest[:8]}.json"
+            with open(shard_dir / shard_name, 'w') as f:
+                f.write(payload)
+            write_precompressed(str(shard_dir / shard_name), precompress)
+            written.add(shard_name)
+            shards.append({
+                'url': f"{shard_dir.name}/{shard_name}",
+                'hash': digest,
+                'count': len(page_images)
+            })
+
+        summary = {k: v for k, v in section.items() if k != 'images'}
+        summary['count'] = len(images)
+        summary['shards'] = shards
+        root_sections.append(summary)
+
+    if journal:
+        journal.close()
+    for stale in shard_dir.iterdir():
+        name = stale.name
+        if name.endswith(('.gz', '.br')):
+            name = name[:-3]
+        if name.endswith('.json') and name not in written:
+            stale.unlink()
+
+    root = {**library, 'sections': root_sections}
+    write_library_json(root, output_file, pretty, precompress)
+    print(f"Shards written to: {shard_dir}/ ({len(written)} files)")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Build 360 image library v4.0'
@@ -369,9 +2729,79 @@ def main():
                         help='Exclude image metadata from output')
     parser.add_argument('--compact', action='store_true',
                         help='Output compact JSON (no pretty-print)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Worker processes for image processing (default: 1, 0 = one per CPU core)')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Ignore the build cache and regenerate every output')
+    parser.add_argument('--max-memory', type=int, default=None, metavar='MB',
+                        help='Low-memory mode: per-image memory budget in MB (draft-decodes JPEGs, streams PNGs in row bands)')
+    parser.add_argument('--shard', action='store_true',
+                        help='Write a small root index plus one JSON shard per section for lazy loading')
+    parser.add_argument('--shard-size', type=int, default=0, metavar='N',
+                        help='With --shard, split sections into shards of N images (default: 0 = one shard per section)')
+    parser.add_argument('--profile', nargs='?', const='summary', default=None,
+                        choices=['summary', 'trace', 'cprofile'],
+                        help='Time each processing stage and print the slowest images and stages; '
+                             '"trace" also writes a Chrome trace, "cprofile" a cProfile dump, next to the output file')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='Keep running and rebuild incrementally whenever images are added, changed or removed')
+    parser.add_argument('--watch-interval', type=float, default=2.0, metavar='SECONDS',
+                        help='With --watch, how often to poll the library folder (default: 2)')
+    parser.add_argument('--debounce', type=float, default=3.0, metavar='SECONDS',
+                        help='With --watch, wait until no file has changed for this long before rebuilding (default: 3)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream image entries through the build journal instead of holding the whole library in memory')
+    parser.add_argument('--precompress', action='store_true',
+                        help='Also write .gz (and .br, if the brotli module is installed) copies of library.json '
+                             'and its shards for static servers')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Define preset fields (label, size, quality, ...) once at the top level '
+                             'instead of in every resolution entry')
+    parser.add_argument('--hashed-names', action='store_true',
+                        help='Put a content hash in every output filename and write an asset manifest '
+                             '(<output>.assets.json), so outputs can be cached as immutable')
+    parser.add_argument('--changes-file', default=None, metavar='PATH',
+                        help='Write a JSON list of the output files this build wrote or removed '
+                             '(e.g. for a deploy script that fixes ownership only on those)')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Encode byte-identical images separately instead of sharing one set of outputs')
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help='Compute a perceptual hash per image and write a near-duplicate report next to the output file')
+    parser.add_argument('--near-duplicate-threshold', type=int, default=6, metavar='BITS',
+                        help='With --near-duplicates, the largest Hamming distance (of 64 bits) reported (default: 6)')
+    parser.add_argument('--priority', action='store_true',
+                        help='Publish library.json with thumbnails and the default preset first, '
+                             'then encode the remaining presets and tiles')
+    parser.add_argument('--publish-interval', type=float, default=60.0, metavar='SECONDS',
+                        help='With --priority, how often library.json is rewritten while the remaining '
+                             'presets are encoded (default: 60)')
+    parser.add_argument('--queue', default=None, metavar='DIR',
+                        help='Coordinate a distributed build: queue the images in DIR (on a shared filesystem) '
+                             'for --worker processes instead of encoding them here')
+    parser.add_argument('--worker', default=None, metavar='DIR',
+                        help='Process images from the --queue in DIR until that build is done '
+                             '(--jobs sets the number of worker processes, --root the library path on this host)')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE, metavar='SECONDS',
+                        help=f'With --queue, re-queue an image when its worker has shown no sign of life '
+                             f'for this long (default: {DEFAULT_LEASE})')
 
     args = parser.parse_args()
 
+    if args.worker:
+        # Workers take their settings from the queue; --root only overrides
+        # where the library is mounted on this host
+        root_dir = args.root if args.root != parser.get_default('root') else None
+        workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        print(f"Worker processes:   {workers} on {socket.gethostname()}, queue {os.path.abspath(args.worker)}")
+        if workers == 1:
+            processed = queue_worker(args.worker, root_dir)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(queue_worker, args.worker, root_dir) for _ in range(workers)]
+                processed = sum(future.result() for future in futures)
+        print(f"Build finished; {processed} image(s) processed here")
+        return
+
     # Load 360-viewer.json config
     site_config = None
     if args.config:
@@ -384,6 +2814,9 @@ def main():
     # Resolve presets: hardcoded defaults -> config overrides
     presets = dict(DEFAULT_PRESETS)  # copy defaults
     thumbnail_config = dict(DEFAULT_THUMBNAIL)
+    tiles_config = None
+    placeholder_config = dict(DEFAULT_PLACEHOLDER)
+    sprite_config = None
     build_dir = '_BUILD'
 
     if site_config and 'build' in site_config:
@@ -398,6 +2831,38 @@ def main():
                     presets[preset_id] = overrides
         if 'thumbnail' in build_config:
             thumbnail_config = {**thumbnail_config, **build_config['thumbnail']}
+        # Drop output formats this Pillow build cannot encode
+        for preset_id, preset in presets.items():
+            if 'formats' in preset:
+                formats = [fmt for fmt in preset['formats'] if format_supported(fmt)]
+                for fmt in preset['formats']:
+                    if fmt not in formats:
+                        print(f"Warning: format '{fmt}' is not supported by this Pillow build, skipping it for {preset_id}")
+                presets[preset_id] = {**preset, 'formats': formats or ['jpeg']}
+        # "tiles": true uses the defaults, an object overrides them
+        if build_config.get('tiles'):
+            tiles_overrides = build_config['tiles'] if isinstance(build_config['tiles'], dict) else {}
+            tiles_config = {**DEFAULT_TILES, **tiles_overrides}
+        # "sprites": true uses the defaults, an object overrides them
+        if build_config.get('sprites'):
+            sprite_overrides = build_config['sprites'] if isinstance(build_config['sprites'], dict) else {}
+            sprite_config = {**DEFAULT_SPRITES, **sprite_overrides}
+            if not format_supported(sprite_config['format']):
+                print(f"Warning: sprite format '{sprite_config['format']}' is not supported by this Pillow build, using jpeg")
+                sprite_config['format'] = 'jpeg'
+        # "placeholder": false turns placeholders off, an object overrides the defaults
+        if 'placeholder' in build_config:
+            if isinstance(build_config['placeholder'], dict):
+                placeholder_config = {**placeholder_config, **build_config['placeholder']}
+            elif not build_config['placeholder']:
+                placeholder_config = None
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    # --priority: the default-flagged preset(s) go first, or the smallest one
+    priority_presets = [preset_id for preset_id, preset in presets.items() if preset.get('default')]
+    if not priority_presets:
+        priority_presets = [sort_presets(presets)[-1][0]]
 
     # Resolve context: --config context wins, --context CLI is fallback
     context = None
@@ -416,33 +2881,194 @@ def main():
     print(f"Scanning directory: {os.path.abspath(args.root)}")
     print(f"Resolution presets: {', '.join(presets.keys())}")
     print(f"Default template:   {args.template}")
-    print(f"Include metadata:   {not args.no_metadata}\n")
-
-    # Scan and build
-    sections, total_images = scan_directory(
-        args.root, presets, thumbnail_config,
-        args.template,
-        include_metadata=not args.no_metadata,
-        site_config=site_config,
-        build_dir=build_dir
-    )
-
-    print(f"\nFound {total_images} images in {len(sections)} sections")
+    print(f"Include metadata:   {not args.no_metadata}")
+    if args.queue:
+        print(f"Work queue:         {os.path.abspath(args.queue)} (lease {args.lease:g}s)")
+    else:
+        print(f"Worker processes:   {jobs}")
+    if args.max_memory:
+        print(f"Memory budget:      {args.max_memory} MB per image")
+    if tiles_config:
+        print(f"Tile pyramid:       {tiles_config['type']}, {tiles_config['tileSize']}px tiles")
+    if sprite_config:
+        print(f"Thumbnail sprites:  {sprite_config['format']}, up to {sprite_config['maxWidth']}x{sprite_config['maxHeight']}px per atlas")
+    if placeholder_config:
+        kinds = [kind for kind in ('blurhash', 'lqip') if placeholder_config.get(kind)]
+        print(f"Placeholders:       {', '.join(kinds) or 'none'}")
+    if args.priority:
+        print(f"Priority build:     thumbnails + {', '.join(priority_presets)} first, published every {args.publish_interval:g}s")
+    if args.precompress:
+        print(f"Precompressed:      {'gzip, brotli' if brotli else 'gzip (pip install brotli for .br)'}")
+    print()
+
+    def publish(sections, total_images, journal_path=None):
+        """Write library.json (or its shards) from scanned sections or the build journal."""
+        library = build_library(sections, total_images, context,
+                                presets=preset_table(presets) if args.normalize else None)
+        if args.shard:
+            write_sharded_library(library, args.output, pretty=not args.compact,
+                                  shard_size=args.shard_size, journal_path=journal_path,
+                                  precompress=args.precompress)
+        elif journal_path:
+            write_streamed_library(library, journal_path, args.output, pretty=not args.compact,
+                                   precompress=args.precompress)
+        else:
+            write_library_json(library, args.output, pretty=not args.compact,
+                               precompress=args.precompress)
+        if journal_path:
+            os.remove(journal_path)
+
+    def build(force=False):
+        """Scan, process and write the library once; returns the image count."""
+        profile_records = [] if args.profile else None
+        changes = {'written': set(), 'removed': set()} if args.changes_file else None
+        profiler = None
+        if args.profile == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        build_start = time.time()
+        journal_path = os.path.join(args.root, build_dir, BUILD_JOURNAL) if args.stream else None
+        scan_options = dict(
+            include_metadata=not args.no_metadata,
+            site_config=site_config,
+            build_dir=build_dir,
+            jobs=jobs,
+            force=force,
+            max_memory=args.max_memory,
+            tiles_config=tiles_config,
+            stream=args.stream,
+            placeholder_config=placeholder_config,
+            profile=profile_records,
+            dedup=not args.no_dedup,
+            perceptual_hash_enabled=args.near_duplicates,
+            hashed_names=args.hashed_names,
+            changes=changes,
+            queue_dir=args.queue,
+            lease=args.lease,
+            sprite_config=sprite_config
+        )
+
+        on_progress = None
+        if args.priority:
+            # Phase 1: a complete, usable library as early as possible
+            print(f"\nPhase 1: thumbnails and {', '.join(priority_presets)}")
+            sections, total_images = scan_directory(
+                args.root, presets, thumbnail_config, args.template,
+                only_presets=priority_presets, **scan_options
+            )
+            print(f"\nPublishing {total_images} images with thumbnails and {', '.join(priority_presets)}...")
+            publish(sections, total_images, journal_path)
+            # Phase 2 tops up what phase 1 wrote, even with --force
+            scan_options['force'] = False
+            print(f"\nPhase 2: remaining presets{' and tiles' if tiles_config else ''}")
+
+            last_publish = time.time()
+            published = sections
+
+            def on_progress(sections):
+                nonlocal last_publish
+                if time.time() - last_publish < args.publish_interval:
+                    return
+                # Start from the phase 1 library so it never shrinks while
+                # phase 2 is still discovering; images that failed in phase 1
+                # wait for the end
+                finished = {
+                    image['id']: image for section in sections for image in section['images']
+                    if image['resolutions']
+                }
+                ready = [
+                    {**section, 'images': [with_sprite(finished.get(image['id'], image), image)
+                                           for image in section['images']]}
+                    for section in published
+                ]
+                publish(ready, sum(len(section['images']) for section in ready))
+                last_publish = time.time()
+
+            def with_sprite(image, previous):
+                """Keep the phase 1 sprite rectangle; phase 2 only packs atlases at the end."""
+                sprite = (previous['thumbnail'] or {}).get('sprite')
+                if not sprite or not image['thumbnail'] or 'sprite' in image['thumbnail']:
+                    return image
+                if image['thumbnail']['path'] != previous['thumbnail']['path']:
+                    return image
+                return {**image, 'thumbnail': {**image['thumbnail'], 'sprite': sprite}}
+
+        # Scan and build
+        sections, total_images = scan_directory(
+            args.root, presets, thumbnail_config, args.template,
+            on_progress=on_progress, **scan_options
+        )
+
+        print(f"\nFound {total_images} images in {len(sections)} sections")
+
+        print(f"\nWriting library file...")
+        publish(sections, total_images, journal_path)
+
+        if args.hashed_names:
+            write_asset_manifest(
+                args.root,
+                os.path.join(args.root, build_dir, BUILD_MANIFEST),
+                f"{os.path.splitext(args.output)[0]}.assets.json"
+            )
 
-    library = build_library(sections, total_images, context)
+        if args.near_duplicates:
+            write_duplicates_report(
+                os.path.join(args.root, build_dir, BUILD_MANIFEST),
+                f"{os.path.splitext(args.output)[0]}.duplicates.json",
+                threshold=args.near_duplicate_threshold
+            )
 
-    print(f"\nWriting library file...")
-    write_library_json(library, args.output, pretty=not args.compact)
+        if changes is not None:
+            output_stem = os.path.splitext(args.output)[0]
+            library_files = [args.output] + [
+                path for path in (f"{args.output}.gz", f"{args.output}.br",
+                                  f"{output_stem}.assets.json", f"{output_stem}.duplicates.json")
+                if os.path.exists(path)
+            ]
+            if args.shard:
+                library_files.append(str(shards_directory(args.output)))
+            with open(args.changes_file, 'w') as f:
+                json.dump({
+                    'root': args.root,
+                    'written': sorted(changes['written']),
+                    'removed': sorted(changes['removed']),
+                    'library': library_files
+                }, f, indent=2)
+
+        if args.profile:
+            if profiler:
+                profiler.disable()
+            print_profile_summary(profile_records, time.time() - build_start)
+            output_stem = os.path.splitext(args.output)[0]
+            if args.profile == 'trace':
+                write_chrome_trace(profile_records, f"{output_stem}.trace.json", build_start)
+            elif profiler:
+                profiler.dump_stats(f"{output_stem}.prof")
+                print(f"cProfile stats written to: {output_stem}.prof (main process only; use --jobs 1 to include image work)")
+        return total_images
+
+    build(force=args.force)
 
     print(f"\n{'=' * 60}")
     print(f"[OK] Library build complete!")
     print(f"{'=' * 60}\n")
     print(f"Generated:")
     print(f"  - {args.output} (v4.0 format)")
+    if args.shard:
+        print(f"  - {shards_directory(args.output)}/ section shards")
+    if args.hashed_names:
+        print(f"  - {os.path.splitext(args.output)[0]}.assets.json asset manifest")
     print(f"  - {build_dir}/ folder with {len(presets)} resolution variants + thumbnails")
     print(f"\nResolution variants:")
     for preset_id, preset in presets.items():
-        print(f"  - {preset_id}: {preset['width']}x{preset['height']} @ Q{preset['quality']}")
+        formats = ', '.join(preset.get('formats', ['jpeg']))
+        budget = preset_byte_budget(preset)
+        limit = f", max {budget} bytes" if budget else ''
+        print(f"  - {preset_id}: {preset['width']}x{preset['height']} @ Q{preset['quality']}{limit} ({formats})")
+
+    if args.watch:
+        watch_library(args.root, build_dir, build, interval=args.watch_interval, debounce=args.debounce)
 
 
 if __name__ == '__main__':
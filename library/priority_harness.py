@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Phong 360 Viewer - Priority Build Harness
+Checks that a --priority build never publishes a smaller library.
+
+- Generates small distinct panoramas in a few sections, offline
+- Runs build_library.py --priority in-process with --publish-interval 0, so
+  phase 2 republishes after every finished image, and records each
+  library.json it writes
+- Checks that every publish lists every image, so the count never drops,
+  and that every published thumbnail keeps its sprite rectangle
+- Repeats the build with --jobs 1 and --jobs 2
+
+Usage:
+    python priority_harness.py
+    python priority_harness.py --images 30 --keep
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import contextlib
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_library  # noqa: E402
+
+SECTIONS = ('Alpha', 'Beta', 'Gamma')
+
+# Tiles are left to phase 2, so every image gets a phase 2 job
+CONFIG = {'build': {'tiles': {'tileSize': 256}, 'sprites': True}}
+
+
+def make_panorama(path, seed):
+    """A 2048x1024 gradient, shifted per seed so no two images share outputs."""
+    img = Image.linear_gradient('L').resize((2048, 1024)).convert('RGB')
+    img = Image.merge('RGB', [band.point(lambda v, k=k: (v + seed * 7 * (k + 1)) % 256)
+                              for k, band in enumerate(img.split())])
+    img.save(path, quality=85)
+
+
+def run_priority_build(root_dir, output_file, config_file, jobs):
+    """Run build_library.main() with --priority; returns every library it published."""
+    published = []
+    write_library_json = build_library.write_library_json
+
+    def record(library, *args, **kwargs):
+        published.append(json.loads(json.dumps(library)))
+        return write_library_json(library, *args, **kwargs)
+
+    argv = sys.argv
+    build_library.write_library_json = record
+    sys.argv = ['build_library.py', '--root', root_dir, '--output', output_file, '--config', config_file,
+                '--priority', '--publish-interval', '0', '--jobs', str(jobs), '--force']
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_library.main()
+    finally:
+        build_library.write_library_json = write_library_json
+        sys.argv = argv
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that priority builds never publish a smaller library'
+    )
+    parser.add_argument('--images', type=int, default=30,
+                        help='Number of panoramas to generate (default: 30)')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the temporary library instead of deleting it')
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix='priority-harness-')
+    root_dir = os.path.join(base, 'library')
+    output_file = os.path.join(base, 'library.json')
+    config_file = os.path.join(base, 'config.json')
+    failures = []
+
+    def check(condition, label):
+        print(f"  [{'PASS' if condition else 'FAIL'}] {label}")
+        if not condition:
+            failures.append(label)
+
+    try:
+        print(f"Harness directory: {base}")
+        for seed in range(args.images):
+            section_dir = os.path.join(root_dir, SECTIONS[seed % len(SECTIONS)])
+            os.makedirs(section_dir, exist_ok=True)
+            make_panorama(os.path.join(section_dir, f"pano-{seed:03d}.jpg"), seed)
+        with open(config_file, 'w') as f:
+            json.dump(CONFIG, f)
+
+        for jobs in (1, 2):
+            print(f"\nPriority build with --jobs {jobs}:")
+            published = run_priority_build(root_dir, output_file, config_file, jobs)
+            counts = [sum(len(section['images']) for section in library['sections']) for library in published]
+            check(len(published) > 2, f'phase 2 republished the library ({len(published)} publishes)')
+            check(counts and min(counts) == args.images,
+                  f"every publish lists all {args.images} images (min {min(counts, default=0)})")
+            check(all(a <= b for a, b in zip(counts, counts[1:])), 'published image count never drops')
+            unsprited = sum(
+                1 for library in published for section in library['sections'] for image in section['images']
+                if image['thumbnail'] and 'sprite' not in image['thumbnail']
+            )
+            check(unsprited == 0, f'every published thumbnail has a sprite ({unsprited} without)')
+            final = published[-1] if published else {'sections': []}
+            tiled = sum(1 for section in final['sections'] for image in section['images'] if image.get('tiles'))
+            check(tiled == args.images, f'final publish has tiles for every image ({tiled})')
+    finally:
+        if args.keep:
+            print(f"Kept {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == '__main__':
+    main()